@@ -0,0 +1,155 @@
+"""Answer a file of queries without the interactive prompt.
+
+Usage: python addmaths_batch.py [INPUT] [--output FILE] [--workers N] [--window N]
+
+INPUT (default: stdin) holds one query per line, either as plain text or as
+a JSON object with a "query" field; other fields of the object, such as an
+"id", are copied to the output. One JSON object per query is written, in
+input order, with its intent, matched topic, latency and response.
+
+The knowledge base is loaded once, here, and handed to every worker process
+through the pool initializer: forked workers share its pages, spawned ones
+unpickle it once. Workers never query the database. At most --window
+chunks of queries are in flight, so memory stays flat however long the
+input is.
+"""
+import argparse
+import json
+import os
+import sys
+import time
+import logging
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from addmaths_engine import AddMathsEngine, Session, configure_logging, logger
+
+BATCH_CHUNK_SIZE = 32   # Queries sent to a worker at a time
+BATCH_WINDOW = 4        # Chunks in flight per worker
+
+_engine = None
+
+
+def init_worker(snapshot):
+    """Pool initializer: an engine serving the parent's snapshot"""
+    global _engine
+    # The parent's log listener thread does not exist here
+    logging.basicConfig(level=logging.WARNING, force=True)
+    _engine = AddMathsEngine(stats_file=None)
+    _engine.use_snapshot(snapshot)
+
+
+def answer_record(engine, record):
+    """Output line for one input record; every query gets a fresh session"""
+    if 'error' in record:
+        return record
+    session = Session()
+    start = time.perf_counter()
+    try:
+        intent, response = engine.answer(record['query'], session)
+    except Exception as e:
+        logger.error("Error processing query '%s': %s", record['query'], e, exc_info=True)
+        return dict(record, error=str(e))
+    latency = time.perf_counter() - start
+    topic = engine.knowledge_base.snapshot.get_topic(session.topic_id) if session.topic_id is not None else None
+    return dict(record, intent=intent, topic_id=session.topic_id, topic=topic['TopicName'] if topic else None,
+                latency_ms=round(latency * 1000, 3), response=response)
+
+
+def answer_chunk(records):
+    return [answer_record(_engine, record) for record in records]
+
+
+def read_records(lines):
+    """Input records, each a dict with a 'query', or an 'error' for an unreadable line"""
+    for number, line in enumerate(lines, 1):
+        line = line.strip()
+        if not line:
+            continue
+        if not line.startswith('{'):
+            yield {'query': line}
+            continue
+        try:
+            record = json.loads(line)
+        except ValueError as e:
+            yield {'line': number, 'error': f"Invalid JSON: {e}"}
+            continue
+        if not isinstance(record, dict) or not isinstance(record.get('query'), str):
+            yield {'line': number, 'error': "Expected an object with a 'query' string"}
+        else:
+            yield record
+
+
+def chunks(records, size):
+    chunk = []
+    for record in records:
+        chunk.append(record)
+        if len(chunk) == size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def run_batch(engine, lines, output, workers=None, window=None, chunk_size=BATCH_CHUNK_SIZE):
+    """Answer every query in lines, writing JSON lines to output; returns
+    the number written. workers=0 answers in this process."""
+    if not engine.ensure_loaded():
+        raise RuntimeError("Unable to load the knowledge base")
+    # The snapshot is fixed for the whole run
+    engine.knowledge_base.stop_auto_refresh()
+    count = 0
+
+    def write(results):
+        nonlocal count
+        for result in results:
+            output.write(json.dumps(result, ensure_ascii=False) + "\n")
+        count += len(results)
+
+    if workers == 0:
+        for chunk in chunks(read_records(lines), chunk_size):
+            write([answer_record(engine, record) for record in chunk])
+        return count
+
+    workers = workers or os.cpu_count() or 1
+    window = window or workers * BATCH_WINDOW
+    with ProcessPoolExecutor(max_workers=workers, initializer=init_worker,
+                             initargs=(engine.knowledge_base.snapshot,)) as pool:
+        pending = deque()
+        for chunk in chunks(read_records(lines), chunk_size):
+            if len(pending) >= window:
+                write(pending.popleft().result())
+            pending.append(pool.submit(answer_chunk, chunk))
+        while pending:
+            write(pending.popleft().result())
+    return count
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('input', nargs='?', help="query file (default: stdin)")
+    parser.add_argument('--output', '-o', help="JSONL output file (default: stdout)")
+    parser.add_argument('--workers', type=int, help="worker processes (default: one per CPU, 0: none)")
+    parser.add_argument('--window', type=int, help="chunks of queries in flight (default: %d per worker)"
+                        % BATCH_WINDOW)
+    parser.add_argument('--chunk-size', type=int, default=BATCH_CHUNK_SIZE)
+    args = parser.parse_args()
+
+    configure_logging()
+    engine = AddMathsEngine(stats_file=None)
+    source = open(args.input, encoding='utf8') if args.input else sys.stdin
+    output = open(args.output, 'w', encoding='utf8') if args.output else sys.stdout
+    start = time.perf_counter()
+    try:
+        count = run_batch(engine, source, output, args.workers, args.window, args.chunk_size)
+    finally:
+        if args.input:
+            source.close()
+        if args.output:
+            output.close()
+        engine.close()
+    logger.info("Answered %d queries in %.1f s", count, time.perf_counter() - start)
+    print(f"Answered {count} queries in {time.perf_counter() - start:.1f} s", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
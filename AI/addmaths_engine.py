@@ -0,0 +1,1580 @@
+"""Core of the AddMaths expert system, shared by the CLI and the GUI.
+
+Importing this module has no side effects: logging is configured by the
+entry points, and an AddMathsEngine only connects to its storage backend
+(see addmaths_storage) and loads the knowledge base on first use. The
+engine can therefore be created cheaply and embedded in other processes.
+"""
+import os
+import re
+import sys
+import copy
+import atexit
+import logging
+import logging.handlers
+import queue
+import threading
+import time
+from collections import OrderedDict, namedtuple
+from contextlib import contextmanager
+from fuzzywuzzy import fuzz
+from topic_index import TopicIndex, TypoIndex
+from search_index import SearchIndex
+from addmaths_storage import create_backend
+from addmaths_metrics import Metrics, STATS_DUMP_INTERVAL
+
+logger = logging.getLogger('addmaths_ai')
+
+# Constants
+FUZZY_MATCH_THRESHOLD = 50
+MAX_POOL_SIZE = 5
+CACHE_POLL_INTERVAL = 30     # Seconds between content change checks
+CACHE_TTL = 6 * 60 * 60      # Seconds before a table's content checksum is checked regardless
+SEARCH_RESULT_LIMIT = 5      # Questions shown by a search
+# Embedding-based matching (see semantic_index); needs requirement-semantic.txt
+SEMANTIC_MODE = os.environ.get("ADDMATHS_SEMANTIC") == "1"
+SEMANTIC_THRESHOLD = 0.5     # Lowest cosine similarity accepted as a semantic match
+QUESTIONS_PAGE_SIZE = 50     # Questions per page of 'list all questions page N'
+STREAM_CHUNK_SIZE = 50       # Questions rendered per chunk when streaming a listing
+ANSWER_CACHE_BYTES = int(os.environ.get("ADDMATHS_ANSWER_CACHE_BYTES", 16 * 1024 * 1024))  # Memoized answers
+LOG_FILE = os.environ.get("ADDMATHS_LOG_FILE", 'addmaths_ai.log')
+LOG_MAX_BYTES = 5 * 1024 * 1024   # Rotate the log at this size...
+LOG_BACKUP_COUNT = 5              # ...keeping this many old files
+LOG_ROTATE_WHEN = os.environ.get("ADDMATHS_LOG_ROTATE_WHEN")  # or by time, e.g. 'midnight'
+ENV_FILE = os.environ.get("ADDMATHS_ENV_FILE", "C:/Users/User/AddmathsAI/AddmathsESKey.env")
+STATS_FILE = os.environ.get("ADDMATHS_STATS_FILE")  # Periodic stats dump; .prom for Prometheus text
+STATS_INTERVAL = float(os.environ.get("ADDMATHS_STATS_INTERVAL", STATS_DUMP_INTERVAL))
+LOAD_ERROR = "Error: Unable to load topics from database. Please check your connection."
+DB_CONFIG = {
+    "host": "localhost",
+    "user": "root",
+    "password": "",
+    "database": "addmaths_es"
+}
+
+class DeferredQueueHandler(logging.handlers.QueueHandler):
+    """Queues records unformatted, so %-style messages are merged on the
+    listener thread rather than by the caller"""
+
+    def prepare(self, record):
+        return record
+
+# Set up logging; called by the entry points, never at import
+def configure_logging(filename=LOG_FILE, level=logging.INFO, max_bytes=LOG_MAX_BYTES,
+                      backup_count=LOG_BACKUP_COUNT, when=LOG_ROTATE_WHEN):
+    """Log through a queue to a rotating file written on a background thread.
+
+    Callers only enqueue records, so logging never waits on disk I/O. The
+    file rotates at max_bytes, or at the interval named by when ('midnight',
+    'h', ... as for TimedRotatingFileHandler) if given, keeping backup_count
+    old files. The listener is stopped, flushing the queue, at exit.
+    """
+    global _log_listener
+    if _log_listener is not None:
+        return _log_listener
+
+    if when:
+        file_handler = logging.handlers.TimedRotatingFileHandler(filename, when=when, backupCount=backup_count,
+                                                                 encoding='utf8')
+    else:
+        file_handler = logging.handlers.RotatingFileHandler(filename, maxBytes=max_bytes, backupCount=backup_count,
+                                                            encoding='utf8')
+    file_handler.setFormatter(logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s'))
+
+    log_queue = queue.SimpleQueue()
+    root = logging.getLogger()
+    root.setLevel(level)
+    root.addHandler(DeferredQueueHandler(log_queue))
+    _log_listener = logging.handlers.QueueListener(log_queue, file_handler, respect_handler_level=True)
+    _log_listener.start()
+    atexit.register(stop_logging)
+    return _log_listener
+
+def stop_logging():
+    """Write out queued log records and stop the background log writer"""
+    global _log_listener
+    if _log_listener is not None:
+        _log_listener.stop()
+        _log_listener = None
+
+_log_listener = None
+
+# Content tables. Rows are grouped into partitions (by topic or by question)
+# so that an edit only refetches the partition it touched.
+TableLayout = namedtuple('TableLayout', 'columns partition primary_key index')
+CONTENT_TABLES = {
+    'topic': TableLayout(('TopicID', 'TopicName'), 'TopicID', 'TopicID', 'topics'),
+    'questions': TableLayout(('QuestionID', 'Description', 'TopicID'), 'TopicID', 'QuestionID', 'questions'),
+    'subquestions': TableLayout(('SubquestionID', 'Description', 'QuestionID'), 'QuestionID', 'SubquestionID',
+                                'subquestions'),
+    'steps': TableLayout(('StepID', 'Description', 'SubquestionID', 'QuestionID'), 'QuestionID', 'StepID', None),
+    'formulas': TableLayout(('FormulaID', 'FormulaContent', 'TopicID'), 'TopicID', 'FormulaID', None),
+}
+
+# Long text columns; every other string column is interned
+TEXT_COLUMNS = {'Description', 'FormulaContent'}
+
+class Record:
+    """Immutable content row with one slot per column.
+
+    Read like the dict rows backends return (row['TopicName']), at a
+    fraction of their size. Each row is stored once and shared by every
+    index, listing and snapshot that refers to it, and IDs and topic names
+    are interned, so a topic name repeated across rows is one string.
+    """
+    __slots__ = ()
+    interned = frozenset()
+
+    def __init_subclass__(cls):
+        super().__init_subclass__()
+        cls.interned = frozenset(cls.__slots__) - TEXT_COLUMNS
+
+    def __init__(self, *values):
+        for column, value in zip(self.__slots__, values):
+            if column in self.interned and isinstance(value, str):
+                value = sys.intern(value)
+            object.__setattr__(self, column, value)
+
+    @classmethod
+    def from_values(cls, values):
+        return cls(*values)
+
+    def values(self):
+        return tuple(getattr(self, column) for column in self.__slots__)
+
+    def __getitem__(self, column):
+        try:
+            return getattr(self, column)
+        except AttributeError:
+            raise KeyError(column) from None
+
+    def get(self, column, default=None):
+        return getattr(self, column, default)
+
+    def __setattr__(self, name, value):
+        raise AttributeError(f"{type(self).__name__} is read-only")
+
+    def __eq__(self, other):
+        return type(self) is type(other) and self.values() == other.values()
+
+    def __hash__(self):
+        return hash(self.values())
+
+    def __reduce__(self):
+        return type(self), self.values()
+
+    def __repr__(self):
+        return f"{type(self).__name__}({', '.join(f'{c}={getattr(self, c)!r}' for c in self.__slots__)})"
+
+class TopicRecord(Record):
+    __slots__ = CONTENT_TABLES['topic'].columns
+
+class QuestionRecord(Record):
+    __slots__ = CONTENT_TABLES['questions'].columns
+
+class SubquestionRecord(Record):
+    __slots__ = CONTENT_TABLES['subquestions'].columns
+
+class StepRecord(Record):
+    __slots__ = CONTENT_TABLES['steps'].columns
+
+class FormulaRecord(Record):
+    __slots__ = CONTENT_TABLES['formulas'].columns
+
+RECORD_TYPES = {'topic': TopicRecord, 'questions': QuestionRecord, 'subquestions': SubquestionRecord,
+                'steps': StepRecord, 'formulas': FormulaRecord}
+
+def record_rows(table):
+    """Row type for backend.stream() building the records of a content table"""
+    return lambda columns: RECORD_TYPES[table].from_values
+
+def select_query(table, partition_count=0, include_null=False):
+    """SELECT for a whole content table, or for the given number of partitions"""
+    layout = CONTENT_TABLES[table]
+    conditions = []
+    if partition_count:
+        conditions.append(f"{layout.partition} IN ({', '.join(['%s'] * partition_count)})")
+    if include_null:
+        conditions.append(f"{layout.partition} IS NULL")
+    query = f"SELECT {', '.join(layout.columns)} FROM {table}"
+    if conditions:
+        query += " WHERE " + " OR ".join(conditions)
+    return query + f" ORDER BY {layout.primary_key}"
+
+# UNION ALL widens mixed key types to text; these restore them
+PARTITION_TYPES = {'TopicID': int, 'QuestionID': str}
+
+def digest_query(tables):
+    """Per-partition row count and checksum of several tables, in one query"""
+    selects = []
+    for table in tables:
+        layout = CONTENT_TABLES[table]
+        selects.append(f"SELECT '{table}' AS TableName, {layout.partition} AS PartitionKey, COUNT(*) AS RowCount, "
+                       f"BIT_XOR(CRC32(CONCAT_WS('|', {', '.join(layout.columns)}))) AS Digest "
+                       f"FROM {table} GROUP BY {layout.partition}")
+    return " UNION ALL ".join(selects)
+
+def topic_bundle_query(topic_count):
+    """A topic page (details, formulas, questions, subquestions) for several topics, in one query"""
+    ids = ', '.join(['%s'] * topic_count)
+    return (f"SELECT 'topic' AS Kind, TopicID, CAST(TopicID AS CHAR) AS RowID, TopicName AS Body, NULL AS ParentID "
+            f"FROM topic WHERE TopicID IN ({ids}) "
+            f"UNION ALL SELECT 'formulas', TopicID, CAST(FormulaID AS CHAR), FormulaContent, NULL "
+            f"FROM formulas WHERE TopicID IN ({ids}) "
+            f"UNION ALL SELECT 'questions', TopicID, QuestionID, Description, NULL "
+            f"FROM questions WHERE TopicID IN ({ids}) "
+            f"UNION ALL SELECT 'subquestions', q.TopicID, s.SubquestionID, s.Description, s.QuestionID "
+            f"FROM subquestions s JOIN questions q ON s.QuestionID = q.QuestionID WHERE q.TopicID IN ({ids})")
+
+# Bundle rows back into the records of each table
+BUNDLE_ROWS = {
+    'topic': lambda row: RECORD_TYPES['topic'](int(row['RowID']), row['Body']),
+    'formulas': lambda row: RECORD_TYPES['formulas'](int(row['RowID']), row['Body'], int(row['TopicID'])),
+    'questions': lambda row: RECORD_TYPES['questions'](row['RowID'], row['Body'], int(row['TopicID'])),
+    'subquestions': lambda row: RECORD_TYPES['subquestions'](row['RowID'], row['Body'], row['ParentID']),
+}
+
+def sort_key(value):
+    # Matches the case-insensitive ordering of the database collation
+    return value.lower() if isinstance(value, str) else value
+
+ROMAN_NUMERALS = {'i': 1, 'v': 5, 'x': 10, 'l': 50}
+
+def roman_value(numeral):
+    total = 0
+    for char, next_char in zip(numeral, numeral[1:] + ' '):
+        value = ROMAN_NUMERALS[char]
+        total += -value if ROMAN_NUMERALS.get(next_char, 0) > value else value
+    return total
+
+def part_sort_keys(question_id, subquestion_ids):
+    """Order a question's parts: (i), (ii), ... (iv) when every suffix is a
+    roman numeral, otherwise alphabetically"""
+    suffixes = {sub_id: sub_id[len(question_id):].lower() if sub_id.lower().startswith(question_id.lower())
+                else sub_id.lower() for sub_id in subquestion_ids}
+    if all(suffix and set(suffix) <= set(ROMAN_NUMERALS) for suffix in suffixes.values()):
+        return {sub_id: (roman_value(suffix), suffix) for sub_id, suffix in suffixes.items()}
+    return {sub_id: (0, suffix) for sub_id, suffix in suffixes.items()}
+
+# A question's worked solution: the steps for the question as a whole and,
+# for each subquestion in order, its own ordered steps
+StepTree = namedtuple('StepTree', 'question steps parts')
+SubquestionSteps = namedtuple('SubquestionSteps', 'subquestion steps')
+
+def build_step_tree(question, subquestions, steps):
+    question_id = question['QuestionID']
+    by_subquestion = {}
+    for step in steps:
+        by_subquestion.setdefault((step['SubquestionID'] or '').lower(), []).append(step)
+    order = part_sort_keys(question_id, [sub['SubquestionID'] for sub in subquestions])
+    parts = []
+    for sub in sorted(subquestions, key=lambda sub: order[sub['SubquestionID']]):
+        sub_steps = by_subquestion.pop(sub['SubquestionID'].lower(), [])
+        parts.append(SubquestionSteps(sub, sorted(sub_steps, key=lambda step: step['StepID'])))
+    # Steps not tied to one of this question's parts belong to the question itself
+    question_steps = [step for sub_steps in by_subquestion.values() for step in sub_steps]
+    question_steps.sort(key=lambda step: step['StepID'])
+    return StepTree(question, question_steps, parts)
+
+def group_rows(rows, column):
+    groups = {}
+    for row in rows:
+        groups.setdefault(row[column], []).append(row)
+    return groups
+
+# In-memory knowledge base
+class KnowledgeSnapshot:
+    """Indexed, read-only copy of the question bank"""
+
+    def __init__(self, partitions=None, version=0):
+        self.version = version
+        # table -> partition key -> rows ordered by primary key
+        self.partitions = partitions or {table: {} for table in CONTENT_TABLES}
+        self.topics = {}
+        self.questions = {}
+        self.subquestions = {}
+        for table, layout in CONTENT_TABLES.items():
+            if layout.index:
+                index = getattr(self, layout.index)
+                for rows in self.partitions[table].values():
+                    for row in rows:
+                        index[row[layout.primary_key]] = row
+        # Lowercased question and subquestion ID -> (question ID, subquestion ID or None)
+        self.question_ids = {}
+        self.step_trees = {}
+        self._build_step_trees(self.questions)
+        self._topic_list = None
+        self._all_questions = None
+
+    def _build_step_trees(self, question_ids):
+        for question_id in question_ids:
+            question = self.questions.get(question_id)
+            if question is None:
+                continue
+            subquestions = self.partitions['subquestions'].get(question_id, [])
+            steps = self.partitions['steps'].get(question_id, [])
+            self.step_trees[question_id] = build_step_tree(question, subquestions, steps)
+            self.question_ids[question_id.lower()] = (question_id, None)
+            for sub in subquestions:
+                self.question_ids[sub['SubquestionID'].lower()] = (question_id, sub['SubquestionID'])
+
+    @classmethod
+    def from_rows(cls, rows_by_table, version=0):
+        partitions = {table: group_rows(rows, CONTENT_TABLES[table].partition)
+                      for table, rows in rows_by_table.items()}
+        return cls(partitions, version)
+
+    def with_partitions(self, table, changed):
+        """Copy-on-write: share everything except the replaced partitions of one table"""
+        layout = CONTENT_TABLES[table]
+        snapshot = copy.copy(self)
+        snapshot.partitions = dict(self.partitions)
+        groups = snapshot.partitions[table] = dict(self.partitions[table])
+        index = None
+        if layout.index:
+            index = dict(getattr(self, layout.index))
+            setattr(snapshot, layout.index, index)
+
+        # Drop all old rows before adding new ones so a row that moved
+        # between partitions is not lost
+        for key in changed:
+            for row in groups.pop(key, ()):
+                if index is not None:
+                    index.pop(row[layout.primary_key], None)
+        for key, rows in changed.items():
+            if rows:
+                groups[key] = rows
+                if index is not None:
+                    for row in rows:
+                        index[row[layout.primary_key]] = row
+
+        # Rebuild the step trees of the affected questions only
+        if table == 'questions':
+            affected = {row['QuestionID'] for key in changed for row in self.partitions[table].get(key, ())}
+            affected.update(row['QuestionID'] for rows in changed.values() for row in rows)
+        elif layout.partition == 'QuestionID':
+            affected = set(changed)
+        else:
+            affected = set()
+        if affected:
+            snapshot.step_trees = dict(self.step_trees)
+            snapshot.question_ids = dict(self.question_ids)
+            for question_id in affected:
+                tree = snapshot.step_trees.pop(question_id, None)
+                if tree is not None:
+                    snapshot.question_ids.pop(question_id.lower(), None)
+                    for part in tree.parts:
+                        snapshot.question_ids.pop(part.subquestion['SubquestionID'].lower(), None)
+            snapshot._build_step_trees(affected)
+
+        snapshot._topic_list = None
+        snapshot._all_questions = None
+        return snapshot
+
+    def get_all_topics(self):
+        if self._topic_list is None:
+            self._topic_list = [self.topics[topic_id] for topic_id in sorted(self.topics)]
+        return self._topic_list
+
+    def get_all_questions(self):
+        # Bank-wide listing of the question records, ordered by topic name
+        # then question ID, the same way the old JOIN query was
+        if self._all_questions is None:
+            all_questions = [q for q in self.questions.values() if q['TopicID'] in self.topics]
+            all_questions.sort(key=lambda q: (self.topics[q['TopicID']]['TopicName'].lower(),
+                                              q['QuestionID'].lower()))
+            self._all_questions = all_questions
+        return self._all_questions
+
+    def get_topic(self, topic_id):
+        return self.topics.get(topic_id)
+
+    def get_formulas_for_topic(self, topic_id):
+        return self.partitions['formulas'].get(topic_id, [])
+
+    def get_questions_for_topic(self, topic_id):
+        return self.partitions['questions'].get(topic_id, [])
+
+    def get_question_by_id(self, question_id):
+        return self.questions.get(str(question_id))
+
+    def resolve_question_id(self, question_id):
+        """(question ID, subquestion ID or None) for a question or subquestion
+        ID in any case, or None if neither exists"""
+        return self.question_ids.get(str(question_id).lower())
+
+    def get_step_tree(self, question_id):
+        return self.step_trees.get(question_id)
+
+class KnowledgeBase:
+    """Loads the content tables once, serves every lookup from memory and
+    refreshes only the partitions whose contents changed"""
+
+    def __init__(self, backend, poll_interval=CACHE_POLL_INTERVAL, ttl=CACHE_TTL, metrics=None):
+        self.backend = backend
+        self.metrics = metrics or Metrics(enabled=False)
+        self.poll_interval = poll_interval
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+        self._listeners = []
+        self.snapshot = KnowledgeSnapshot()
+        self.versions = {}    # table -> backend change marker
+        self.checksums = {}   # table -> backend table checksum
+        self.digests = {}     # table -> partition key -> (row count, digest)
+        self.checked_at = {}  # table -> monotonic time its checksum was last fetched
+
+    def subscribe(self, callback):
+        """Call callback(snapshot, changed_tables) after every refresh that changed data"""
+        self._listeners.append(callback)
+
+    def _fetch_versions(self):
+        return self.backend.table_versions(list(CONTENT_TABLES))
+
+    def _fetch_digests(self, tables):
+        digests = {table: {} for table in tables}
+        for row in self.backend.query(digest_query(tables)):
+            key = row['PartitionKey']
+            if key is not None:
+                key = PARTITION_TYPES[CONTENT_TABLES[row['TableName']].partition](key)
+            digests[row['TableName']][key] = (int(row['RowCount']), int(row['Digest']))
+        return digests
+
+    def _fetch_partitions(self, table, keys=None):
+        # Streamed, so records are built as rows arrive instead of after the
+        # full result has been buffered
+        if keys is None:
+            query, params = select_query(table), None
+        else:
+            params = tuple(key for key in keys if key is not None)
+            query = select_query(table, len(params), None in keys)
+        return [row for chunk in self.backend.stream(query, params, record_rows(table)) for row in chunk]
+
+    def fetch_topic_bundle(self, topic_ids):
+        """Rows of the topic, formulas, questions and subquestions tables for
+        the given topics, fetched in a single round trip"""
+        topic_ids = list(topic_ids)
+        bundle = {table: [] for table in BUNDLE_ROWS}
+        if not topic_ids:
+            return bundle
+        for row in self.backend.query(topic_bundle_query(len(topic_ids)), tuple(topic_ids) * 4):
+            bundle[row['Kind']].append(BUNDLE_ROWS[row['Kind']](row))
+        for table, rows in bundle.items():
+            primary_key = CONTENT_TABLES[table].primary_key
+            rows.sort(key=lambda row: sort_key(row[primary_key]))
+        return bundle
+
+    def _fetch_stale_rows(self, stale):
+        """Fetch the rows of every stale partition, batching topic-scoped
+        tables into a single topic bundle"""
+        rows = {}
+        bundled = {table: keys for table, keys in stale.items()
+                   if keys and CONTENT_TABLES[table].partition == 'TopicID'}
+        if bundled:
+            bundle = self.fetch_topic_bundle(sorted(set().union(*bundled.values())))
+            for table, keys in bundled.items():
+                partition = CONTENT_TABLES[table].partition
+                rows[table] = [row for row in bundle[table] if row[partition] in keys]
+            # The bundle also carries the subquestions of every bundled question
+            bundled_questions = {row['QuestionID'] for row in bundle['questions']}
+            if 'subquestions' in stale and stale['subquestions'] <= bundled_questions:
+                keys = stale['subquestions']
+                rows['subquestions'] = [row for row in bundle['subquestions'] if row['QuestionID'] in keys]
+
+        for table, keys in stale.items():
+            if table not in rows:
+                rows[table] = self._fetch_partitions(table, keys) if keys else []
+        return rows
+
+    def load(self):
+        """Fetch every table and atomically swap in a freshly indexed snapshot"""
+        with self._lock:
+            # Markers and checksums first, rows last: a concurrent edit then
+            # shows up as a changed marker on the next poll instead of being
+            # missed
+            versions = self._fetch_versions()
+            checksums = self.backend.table_checksums(list(CONTENT_TABLES))
+            digests = self._fetch_digests(list(CONTENT_TABLES))
+            rows = {table: self._fetch_partitions(table) for table in CONTENT_TABLES}
+
+            # Readers hold a reference to the old snapshot until they finish
+            self.snapshot = KnowledgeSnapshot.from_rows(rows, self.snapshot.version + 1)
+            self.versions = versions
+            self.checksums = checksums
+            self.digests = digests
+            self.checked_at = dict.fromkeys(CONTENT_TABLES, time.monotonic())
+            logger.info("Knowledge base loaded: %d topics, %d questions, %d steps",
+                        len(rows['topic']), len(rows['questions']), len(rows['steps']))
+        return self.snapshot
+
+    def install(self, snapshot):
+        """Serve a snapshot loaded elsewhere, such as by a parent process.
+        Nothing is fetched, so refresh() must not be used afterwards."""
+        with self._lock:
+            self.snapshot = snapshot
+
+    def refresh(self):
+        """Poll the tables' change markers and refetch only the partitions
+        whose digests changed.
+
+        Tables older than the TTL also have their content checksums
+        compared, which catches edits the markers missed; either way only a
+        real difference in the digests changes the snapshot. The current
+        snapshot keeps serving until the new one is swapped in.
+        """
+        with self._lock:
+            versions = self._fetch_versions()
+            now = time.monotonic()
+            expired = [table for table in CONTENT_TABLES if now - self.checked_at.get(table, 0) > self.ttl]
+            checksums = self.backend.table_checksums(expired) if expired else {}
+            candidates = [table for table in CONTENT_TABLES
+                          if versions.get(table) != self.versions.get(table)
+                          or (table in checksums and checksums[table] != self.checksums.get(table))]
+            if not candidates:
+                self.versions = versions
+                self.checksums.update(checksums)
+                for table in expired:
+                    self.checked_at[table] = now
+                return self.snapshot
+
+            digests = self._fetch_digests(candidates)
+            stale = {}
+            for table in candidates:
+                old_digests = self.digests.get(table, {})
+                stale[table] = {key for key in set(digests[table]) | set(old_digests)
+                                if digests[table].get(key) != old_digests.get(key)}
+            rows = self._fetch_stale_rows(stale)
+
+            snapshot = self.snapshot
+            changed_tables = []
+            for table in candidates:
+                if not stale[table]:
+                    continue
+                changed = dict.fromkeys(stale[table], [])
+                changed.update(group_rows(rows[table], CONTENT_TABLES[table].partition))
+                snapshot = snapshot.with_partitions(table, changed)
+                changed_tables.append(table)
+                self.metrics.count('kb_partitions_refreshed', len(stale[table]))
+                logger.info("Refreshed %d partition(s) of table '%s'", len(stale[table]), table)
+
+            # Only now that every fetch has succeeded; a failed one leaves the
+            # old markers and checksums, so the next poll retries the change
+            self.versions = versions
+            self.checksums.update(checksums)
+            self.digests.update(digests)
+            for table in expired:
+                self.checked_at[table] = now
+            if not changed_tables:
+                return self.snapshot
+            snapshot.version = self.snapshot.version + 1
+            self.snapshot = snapshot
+
+        for callback in self._listeners:
+            callback(snapshot, changed_tables)
+        return snapshot
+
+    def _refresh_loop(self):
+        while not self._stop.wait(self.poll_interval):
+            try:
+                with self.metrics.stage('kb_refresh'):
+                    self.refresh()
+            except Exception as e:
+                logger.error("Knowledge base refresh failed, keeping current data: %s", e)
+
+    def start_auto_refresh(self):
+        """Poll for content changes on a background thread"""
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._refresh_loop, name="kb-refresh", daemon=True)
+        self._thread.start()
+
+    def stop_auto_refresh(self):
+        self._stop.set()
+
+    def clear(self):
+        self.stop_auto_refresh()
+        with self._lock:
+            self.snapshot = KnowledgeSnapshot(version=self.snapshot.version + 1)
+            self.versions = {}
+            self.checksums = {}
+            self.digests = {}
+            self.checked_at = {}
+
+# Text processing utilities
+def normalize_input(user_input):
+    """Normalize and clean user input"""
+    return re.sub(r'\s+', ' ', user_input.strip().lower())
+
+# Pattern matching for user queries
+# Question IDs are a number with optional part letters: 5, 10a, 10aii
+QUESTION_ID_PATTERNS = [
+    re.compile(r'question\s+(\d+[a-z]*)\b'),  # question 10a
+    re.compile(r'\bq\s*(\d+[a-z]*)\b'),       # q10a or q 10a
+    re.compile(r'#\s*(\d+[a-z]*)\b'),          # #10a or # 10a
+    re.compile(r'number\s+(\d+[a-z]*)\b'),    # number 10a
+    re.compile(r'\b(\d+[a-z]*)\b'),           # Just try to find any ID as a fallback
+    re.compile(r'(\d+)'),                     # or any number at all
+]
+
+# A question number, a part letter and a roman numeral subpart: 10, a, ii
+PART_ID_PATTERN = re.compile(r'(\d+)([a-z]?)([ivxl]*)')
+
+LIST_QUESTIONS_PATTERNS = [
+    re.compile(r'(list|show|get|what|give)\s+.*(questions|problems|exercises).*(?:for|on|about|in)\s+(.+)'),
+    re.compile(r'questions\s+(?:for|on|about|in)\s+(.+)'),
+    re.compile(r'problems\s+(?:for|on|about|in)\s+(.+)'),
+]
+
+def extract_question_id(query_text):
+    """Extract question ID ('5', '10a', '10ai') from input text"""
+    for pattern in QUESTION_ID_PATTERNS:
+        match = pattern.search(query_text)
+        if match:
+            return match.group(1).lower()
+    return None
+
+def extract_listed_topic(query_text):
+    """Topic named in a 'list questions for ...' request, as an argument tuple"""
+    for pattern in LIST_QUESTIONS_PATTERNS:
+        match = pattern.search(query_text)
+        if match:
+            # The topic is always the last group
+            return (match.groups()[-1].strip(),)
+    return None
+
+PAGE_PATTERN = re.compile(r'\bpage\s*(\d+)')
+
+def extract_page(query_text):
+    """Page number of a paged listing, as an argument tuple (empty for the whole list)"""
+    match = PAGE_PATTERN.search(query_text)
+    return (int(match.group(1)),) if match else ()
+
+ORDINALS = {'first': 1, 'second': 2, 'third': 3, 'fourth': 4, 'fifth': 5, 'sixth': 6, 'seventh': 7,
+            'eighth': 8, 'ninth': 9, 'tenth': 10, 'last': -1}
+ORDINAL_PATTERN = re.compile(r'\b(first|second|third|fourth|fifth|sixth|seventh|eighth|ninth|tenth|last'
+                             r'|\d+(?:st|nd|rd|th))\s+(?:one|question|problem)\b')
+NEXT_PATTERN = re.compile(r'\b(next|previous)\s+(?:one|question|problem)\b|^(next|previous)$')
+# After the reference, 'the last question on janjang' names a topic, so
+# it is not a follow-up; 'steps for the last one' is
+TOPIC_CLAUSE_PATTERN = re.compile(r'\s(?:for|on|about|in)\s+\w')
+
+def extract_follow_up(query_text):
+    """('ordinal', n) for 'the second one' (-1 for 'the last one'), or
+    ('move', +1/-1) for 'next question' / 'previous question'"""
+    match = ORDINAL_PATTERN.search(query_text)
+    if match:
+        word = match.group(1)
+        args = ('ordinal', ORDINALS[word] if word in ORDINALS else int(word[:-2]))
+    else:
+        match = NEXT_PATTERN.search(query_text)
+        if not match:
+            return None
+        args = ('move', 1 if (match.group(1) or match.group(2)) == 'next' else -1)
+    if TOPIC_CLAUSE_PATTERN.search(query_text, match.end()):
+        return None
+    return args
+
+SEARCH_PATTERN = re.compile(r'^(?:search|find)\s+(?:for\s+)?(.+)')
+
+def extract_search_text(query_text):
+    match = SEARCH_PATTERN.search(query_text)
+    return (match.group(1).strip(),) if match else None
+
+def requires_question_id(query_text):
+    return () if extract_question_id(query_text) else None
+
+# Intent table, in priority order. An intent applies when one of its
+# trigger patterns occurs in the query and its extractor (if any) returns an
+# argument tuple rather than None. New intents are added here.
+IntentRule = namedtuple('IntentRule', 'name triggers extract')
+INTENT_RULES = [
+    IntentRule('help', [r'^help$'], None),
+    IntentRule('stats', [r'^stats$'], None),
+    IntentRule('search', [r'^search\b', r'^find\b'], extract_search_text),
+    IntentRule('list_all_questions', ['all questions', 'every question', 'list all questions', 'show all questions',
+                                      'all problems', 'every problem', 'all exercises'], extract_page),
+    IntentRule('list_topics', ['list topic', 'show topic', 'all topic', 'what topic', 'available topic'], None),
+    IntentRule('follow_up', [r'\b(?:first|second|third|fourth|fifth|sixth|seventh|eighth|ninth|tenth|last'
+                             r'|\d+(?:st|nd|rd|th))\s+(?:one|question|problem)\b',
+                             r'\b(?:next|previous)\b'], extract_follow_up),
+    IntentRule('show_steps', ['step', 'solution', 'solve', 'how to'], requires_question_id),
+    IntentRule('list_questions_for_topic', ['questions', 'problems', 'exercises'], extract_listed_topic),
+]
+DEFAULT_INTENT = 'show_topic_info'
+
+def compile_intent_rules(rules):
+    """Combine every trigger into one pattern with a named group per intent.
+
+    The alternation sits inside a lookahead so a single finditer() pass
+    reports triggers at every position, even where they overlap.
+    """
+    alternatives = [f"(?P<{rule.name}>{'|'.join(rule.triggers)})" for rule in rules]
+    return re.compile(f"(?=(?:{'|'.join(alternatives)}))")
+
+INTENT_PATTERN = compile_intent_rules(INTENT_RULES)
+
+def determine_intent(user_query):
+    """Determine user intent from query"""
+    query = user_query.lower()
+    triggered = {match.lastgroup for match in INTENT_PATTERN.finditer(query)}
+    
+    for rule in INTENT_RULES:
+        if rule.name not in triggered:
+            continue
+        args = rule.extract(query) if rule.extract else ()
+        if args is not None:
+            return (rule.name, *args) if args else rule.name
+    
+    # Default intent is to show topic information
+    return DEFAULT_INTENT
+
+# Expert system engine
+class Session:
+    """Conversation state of one user, so follow-ups such as 'steps for the
+    second one' or 'next question' resolve against what they last saw.
+
+    Each CLI, GUI window or API client keeps its own; the engine's default
+    session serves callers that do not pass one.
+    """
+
+    def __init__(self):
+        self.topic_id = None
+        self.shown_questions = ()   # Question rows last listed, in display order
+        self.question_id = None     # Question whose steps were last shown
+        self.position = None        # Its index in shown_questions, if listed there
+        self.updates = None         # (method, args) of each update while recording
+
+    @contextmanager
+    def recording(self):
+        """Collect the updates made inside the block, for replay() on another session"""
+        self.updates = updates = []
+        try:
+            yield updates
+        finally:
+            self.updates = None
+
+    def replay(self, updates):
+        for method, args in updates:
+            getattr(self, method)(*args)
+
+    def show_questions(self, questions, topic_id=None):
+        if self.updates is not None:
+            self.updates.append(('show_questions', (questions, topic_id)))
+        self.shown_questions = questions
+        self.topic_id = topic_id
+        # 'next question' now starts from the top of the new list
+        self.question_id = None
+        self.position = None
+
+    def view_question(self, question, position=None):
+        if self.updates is not None:
+            self.updates.append(('view_question', (question, position)))
+        self.question_id = question['QuestionID']
+        self.topic_id = question['TopicID']
+        if position is None:
+            position = next((index for index, shown in enumerate(self.shown_questions)
+                             if shown['QuestionID'] == self.question_id), None)
+        self.position = position
+
+CachedAnswer = namedtuple('CachedAnswer', 'version intent response updates size')
+
+class AnswerCache:
+    """Responses by normalized query, each valid for one knowledge base version.
+
+    An entry also keeps the session updates its handler made (the questions
+    it listed, the question it showed), so replaying them on a hit leaves
+    the session as answering afresh would. Least recently used entries are
+    evicted once the cached text passes max_bytes.
+    """
+
+    def __init__(self, max_bytes=ANSWER_CACHE_BYTES, metrics=None):
+        self.max_bytes = max_bytes
+        self.metrics = metrics or Metrics(enabled=False)
+        self.entries = OrderedDict()   # normalized query -> CachedAnswer, least recently used first
+        self.bytes = 0
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.entries)
+
+    def get(self, query, version):
+        with self._lock:
+            entry = self.entries.get(query)
+            if entry is None or entry.version != version:
+                return None
+            self.entries.move_to_end(query)
+            return entry
+
+    def put(self, query, version, intent, response, updates):
+        size = sys.getsizeof(query) + sys.getsizeof(response)
+        # One huge listing should not flush everything else
+        if size > self.max_bytes // 4:
+            return
+        with self._lock:
+            old = self.entries.pop(query, None)
+            if old is not None:
+                self.bytes -= old.size
+            self.entries[query] = CachedAnswer(version, intent, response, tuple(updates), size)
+            self.bytes += size
+            while self.bytes > self.max_bytes:
+                _, evicted = self.entries.popitem(last=False)
+                self.bytes -= evicted.size
+                self.metrics.count('answer_cache_evictions')
+
+    def clear(self):
+        with self._lock:
+            self.entries.clear()
+            self.bytes = 0
+
+class AddMathsEngine:
+    """Answers user queries from an in-memory copy of the question bank.
+
+    The storage backend connects on the first database access and the
+    knowledge base is loaded on the first query (or by preload()), so
+    constructing an engine is cheap. Without a backend, create_backend()
+    picks MySQL or the embedded SQLite copy from ADDMATHS_BACKEND.
+    """
+
+    def __init__(self, backend=None, db_config=None, pool_size=MAX_POOL_SIZE, env_file=ENV_FILE, metrics=None,
+                 stats_file=STATS_FILE, semantic=SEMANTIC_MODE):
+        self.backend = backend or create_backend(db_config=db_config or DB_CONFIG, pool_size=pool_size,
+                                                 env_file=env_file)
+        self._load_lock = threading.Lock()
+        self.metrics = metrics or Metrics()
+        self.backend.metrics = self.metrics
+        self.stats_file = stats_file
+
+        self.knowledge_base = KnowledgeBase(self.backend, metrics=self.metrics)
+        self.knowledge_base.subscribe(self.refresh_topic_index)
+        self.topics_cache = {}
+        self.topic_index = TopicIndex({}, FUZZY_MATCH_THRESHOLD)
+        self.typo_index = TypoIndex({})
+        self.session = Session()
+        # Full-text index over question, subquestion and step text, kept in
+        # step with the snapshot it was built from
+        self.search_index = SearchIndex()
+        self._search_lock = threading.Lock()
+        self._indexed_snapshot = None
+        # Precomputed embeddings, loaded with the knowledge base in semantic mode
+        self.semantic = semantic
+        self.semantic_index = None
+        self.last_round_trips = 0
+        # (intent, topic ID or None) -> (knowledge base version, response text)
+        self.rendered_cache = {}
+        self.answer_cache = AnswerCache(metrics=self.metrics)
+        # Knowledge base version the topic matcher and search index were last
+        # built or updated for; None until they are first built
+        self.indexed_version = None
+
+    def ensure_loaded(self):
+        """Load the knowledge base if it is not loaded yet; True once it is.
+
+        Concurrent callers wait for a single load. A failed load is retried
+        on the next call.
+        """
+        if self.ready:
+            return True
+        with self._load_lock:
+            if self.ready:
+                return True
+            try:
+                snapshot = self.knowledge_base.load()
+            except Exception as e:
+                logger.critical("Failed to load knowledge base: %s", e)
+                return False
+            if not self.build_indexes(snapshot):
+                return False
+            self.knowledge_base.start_auto_refresh()
+            if self.stats_file:
+                self.metrics.start_dump(self.stats_file, STATS_INTERVAL)
+            logger.info("Loaded %d topics from database", len(snapshot.topics))
+            return True
+
+    @property
+    def ready(self):
+        """True once the knowledge base is loaded and indexed"""
+        return self.indexed_version is not None
+
+    def use_snapshot(self, snapshot):
+        """Answer from an already loaded snapshot without touching the
+        database, as batch worker processes do; True if it has topics"""
+        with self._load_lock:
+            self.knowledge_base.install(snapshot)
+            return self.build_indexes(snapshot)
+
+    def build_indexes(self, snapshot):
+        """Build the topic matcher and search index of a freshly loaded snapshot"""
+        all_topics = snapshot.get_all_topics()
+        if not all_topics:
+            logger.critical("Failed to load topics from database")
+            return False
+        self.preprocess_topics(all_topics)
+        with self._search_lock:
+            self.search_index = SearchIndex.from_snapshot(snapshot)
+            self._indexed_snapshot = snapshot
+        if self.semantic:
+            self.load_semantic_index(snapshot)
+        self.answer_cache.clear()
+        self.indexed_version = snapshot.version
+        return True
+
+    def load_semantic_index(self, snapshot):
+        """Open the embeddings written by semantic_index.py; semantic matching
+        stays off if they or the libraries it needs are missing"""
+        try:
+            # Imported here so that numpy and transformers are only loaded in semantic mode
+            from semantic_index import SemanticIndex
+            index = SemanticIndex.load()
+            index.sync(snapshot)
+            index.embedder.load()
+        except (ImportError, OSError, ValueError, KeyError) as e:
+            logger.error("Semantic matching disabled: %s", e)
+            return
+        self.semantic_index = index
+        logger.info("Loaded semantic index of %d topics and questions", len(index))
+
+    def preload(self):
+        """Start loading the knowledge base on a background thread"""
+        thread = threading.Thread(target=self.ensure_loaded, name="kb-preload", daemon=True)
+        thread.start()
+        return thread
+
+    def close(self):
+        """Stop background work and drop cached data"""
+        self.metrics.stop_dump()
+        if self.stats_file and self.metrics.enabled:
+            try:
+                self.metrics.dump(self.stats_file)
+            except OSError as e:
+                logger.error("Failed to write statistics to %s: %s", self.stats_file, e)
+        self.indexed_version = None
+        self.knowledge_base.clear()
+        self.backend.close()
+        logger.info("All caches cleared")
+
+    # Topic matching
+    def preprocess_topics(self, topics):
+        """Preprocess topics for faster matching"""
+        self.topics_cache = {topic['TopicID']: topic['TopicName'].lower() for topic in topics}
+        self.topic_index = TopicIndex(self.topics_cache, FUZZY_MATCH_THRESHOLD)
+        self.typo_index = TypoIndex(self.topics_cache)
+        logger.debug("Topics preprocessed: %d topics cached, %d trigrams and %d spelling variants indexed",
+                     len(self.topics_cache), len(self.topic_index.postings), len(self.typo_index.deletes))
+
+    def refresh_topic_index(self, snapshot, changed_tables):
+        """Keep the topic matcher, search index and rendered responses in step
+        with knowledge base refreshes"""
+        if 'topic' in changed_tables:
+            self.preprocess_topics(snapshot.get_all_topics())
+        with self._search_lock:
+            if self._indexed_snapshot is not None:
+                self.search_index.update(self._indexed_snapshot, snapshot, changed_tables)
+                self._indexed_snapshot = snapshot
+        if self.semantic_index is not None and not {'topic', 'questions'}.isdisjoint(changed_tables):
+            self.semantic_index.sync(snapshot)
+        self.rendered_cache.clear()
+        self.answer_cache.clear()
+        self.indexed_version = snapshot.version
+
+    def search(self, text, limit=SEARCH_RESULT_LIMIT):
+        """Best (score, question ID, subquestion ID) full-text matches for text"""
+        with self.metrics.stage('search'), self._search_lock:
+            return self.search_index.search(text, limit)
+
+    def semantic_match(self, text, kind=None, limit=SEARCH_RESULT_LIMIT):
+        """Best (similarity, kind, ID) semantic matches above SEMANTIC_THRESHOLD;
+        empty unless semantic mode is on"""
+        if self.semantic_index is None:
+            return []
+        with self.metrics.stage('semantic'):
+            results = self.semantic_index.search(text, limit, kind)
+        return [result for result in results if result[0] >= SEMANTIC_THRESHOLD]
+
+    def render_cached(self, snapshot, intent, topic_id, render):
+        """Response text for an intent and topic, rendered from snapshot once
+        per knowledge base version"""
+        key = (intent, topic_id)
+        cached = self.rendered_cache.get(key)
+        if cached is not None and cached[0] == snapshot.version:
+            self.metrics.cache('response_cache', True)
+            return cached[1]
+        self.metrics.cache('response_cache', False)
+        with self.metrics.stage('render'):
+            text = render(snapshot)
+        self.rendered_cache[key] = (snapshot.version, text)
+        return text
+
+    def fuzzy_match_topic(self, user_query, topics_dict=None):
+        """Find the best matching topic using fuzzy logic.
+
+        Without topics_dict the trigram index built by preprocess_topics is
+        used, after misspelt topic words in the query are corrected ('fungsy'
+        -> 'fungsi'); the uncorrected query is scored too and the better
+        match wins. Passing a dict falls back to scoring every entry.
+        """
+        if topics_dict is None:
+            with self.metrics.stage('match'):
+                corrected = self.correct_spelling(user_query)
+                match = self.topic_index.best_match(corrected)
+                if corrected != user_query:
+                    original = self.topic_index.best_match(user_query)
+                    if original and (not match or original[1] > match[1]):
+                        match = original
+                return match
+
+        best_match = None
+        best_topic_id = None
+        highest_score = 0
+        
+        for topic_id, topic_name in topics_dict.items():
+            score = fuzz.token_sort_ratio(user_query, topic_name)
+            if score > highest_score and score > FUZZY_MATCH_THRESHOLD:
+                highest_score = score
+                best_match = topic_name
+                best_topic_id = topic_id
+        
+        return (best_match, highest_score, best_topic_id) if best_match else None
+
+    def correct_spelling(self, text):
+        """text with words that are near misses of topic words corrected"""
+        corrected = self.typo_index.correct(text)
+        if corrected != text.lower():
+            self.metrics.count('spelling_corrections')
+        return corrected
+
+    def did_you_mean(self, text):
+        """A 'Did you mean ...?' line naming the topics spelt most like the
+        words of text, or an empty string"""
+        kb = self.knowledge_base.snapshot
+        names = [kb.get_topic(topic_id)['TopicName'] for topic_id in self.typo_index.suggest(text)
+                 if kb.get_topic(topic_id)]
+        if not names:
+            return ""
+        return f"Did you mean {' or '.join(repr(name) for name in names)}?\n"
+
+    # Command handlers
+    def handle_list_all_questions(self, page=None, session=None):
+        """Handler for listing all questions, or one page of them"""
+        kb = self.knowledge_base.snapshot
+        if page is None:
+            (session or self.session).show_questions(kb.get_all_questions())
+            return self.render_cached(kb, 'list_all_questions', None,
+                                      lambda kb: "\n".join(self.iter_all_questions(kb=kb)))
+        return "\n".join(self.iter_all_questions(page, kb, session or self.session))
+
+    def stream_all_questions(self, page=None, session=None):
+        """Chunks of the response to list_all_questions. The full listing is
+        served from, or once streamed to the end stored in, the same
+        rendered cache entry as handle_list_all_questions()"""
+        session = session or self.session
+        if page is not None:
+            yield from self.iter_all_questions(page, session=session)
+            return
+        kb = self.knowledge_base.snapshot
+        cached = self.rendered_cache.get(('list_all_questions', None))
+        if cached is not None and cached[0] == kb.version:
+            self.metrics.cache('response_cache', True)
+            session.show_questions(kb.get_all_questions())
+            yield cached[1]
+            return
+        self.metrics.cache('response_cache', False)
+        chunks = []
+        for chunk in self.iter_all_questions(kb=kb, session=session):
+            chunks.append(chunk)
+            yield chunk
+        # Not reached when the consumer stops early
+        self.rendered_cache[('list_all_questions', None)] = (kb.version, "\n".join(chunks))
+
+    def iter_all_questions(self, page=None, kb=None, session=None):
+        """Render every question in the bank (or one page of
+        QUESTIONS_PAGE_SIZE) grouped under topic headers, yielding a chunk of
+        text every STREAM_CHUNK_SIZE questions. Joined with newlines, the
+        chunks make up the full response. The listed questions become the
+        session's, if one is given."""
+        kb = kb or self.knowledge_base.snapshot
+        all_questions = kb.get_all_questions()
+        
+        if not all_questions:
+            yield "No questions available in the database."
+            return
+        
+        if page is None:
+            questions = all_questions
+            output = ["\nAll Available Questions:", "======================="]
+        else:
+            page_count = -(-len(all_questions) // QUESTIONS_PAGE_SIZE)
+            page = max(page, 1)
+            if page > page_count:
+                yield f"There {'is' if page_count == 1 else 'are'} only {page_count} page(s) of questions."
+                return
+            start = (page - 1) * QUESTIONS_PAGE_SIZE
+            questions = all_questions[start:start + QUESTIONS_PAGE_SIZE]
+            heading = f"All Available Questions (page {page} of {page_count}):"
+            output = [f"\n{heading}", "=" * len(heading)]
+        if session is not None:
+            session.show_questions(questions)
+        current_topic = None
+        
+        for count, question in enumerate(questions, 1):
+            # Print topic header when topic changes
+            topic_name = kb.topics[question['TopicID']]['TopicName']
+            if current_topic != topic_name:
+                current_topic = topic_name
+                output.append(f"\n[{current_topic}]")
+            
+            output.append(f"ID: {question['QuestionID']} - {question['Description']}")
+            if count % STREAM_CHUNK_SIZE == 0:
+                yield "\n".join(output)
+                output = []
+        
+        if page is not None and page < page_count:
+            output.append(f"\nPage {page} of {page_count}. Type 'list all questions page {page + 1}' for more.")
+        output.append("\nTo see steps for any question, ask 'show steps for question #'")
+        yield "\n".join(output)
+
+    def handle_list_topics(self):
+        """Handler for listing all topics"""
+        return self.render_cached(self.knowledge_base.snapshot, 'list_topics', None, self.render_topic_list)
+
+    def render_topic_list(self, kb):
+        """Names of all topics"""
+        all_topics = kb.get_all_topics()
+        topic_names = [topic['TopicName'] for topic in all_topics]
+        
+        output = ["\nAvailable Topics:", "----------------"]
+        for name in topic_names:
+            output.append(f"- {name}")
+        
+        output.append("\nFor information on a topic, just type its name.")
+        output.append("To see questions for a topic, type 'list questions for [topic name]'")
+        
+        return "\n".join(output)
+
+    def handle_show_steps(self, normalized_query, session=None):
+        """Handler for showing steps to solve a question"""
+        question_id = extract_question_id(normalized_query)
+        if not question_id:
+            return "I couldn't identify which question you're asking about. Please include a question number."
+        
+        kb = self.knowledge_base.snapshot
+        resolved = kb.resolve_question_id(question_id)
+        if not resolved:
+            # Drop only the letters that cannot name a part of the question
+            # ('q3x' -> '3' when question 3 has no part x); an unknown part
+            # such as 9biii is reported, never swapped for a neighbour
+            number, letter, numeral = PART_ID_PATTERN.match(question_id).groups()
+            parts = sorted(key for key in kb.question_ids
+                           if key.startswith(number) and key[len(number):len(number) + 1].isalpha())
+            if letter not in {key[len(number)] for key in parts}:
+                candidate = number
+            elif not any(key.startswith(number + letter) and len(key) > len(number) + 1 for key in parts):
+                candidate = number + letter
+            else:
+                candidate = number + letter + numeral
+            if candidate != question_id:
+                resolved = kb.resolve_question_id(candidate)
+            if not resolved:
+                message = f"Question with ID {question_id} not found."
+                if parts:
+                    names = ', '.join(kb.question_ids[key][1] or kb.question_ids[key][0] for key in parts)
+                    message += f" Question {number} has parts: {names}."
+                return message
+        
+        return self.render_steps(kb, resolved, session or self.session)
+
+    def handle_follow_up(self, kind, value, session=None):
+        """Handler for 'steps for the second one', 'next question' and the
+        like, resolved from the session without touching the database"""
+        session = session or self.session
+        kb = self.knowledge_base.snapshot
+        shown = session.shown_questions
+        if kind == 'ordinal':
+            if not shown:
+                return ("I'm not sure which question you mean.\n"
+                        "List some questions first, e.g. 'list questions for Fungsi'.")
+            index = value - 1 if value > 0 else len(shown) + value
+            if not 0 <= index < len(shown):
+                return f"The last list only had {len(shown)} question(s)."
+        else:
+            if session.question_id is None:
+                if not shown:
+                    return ("I'm not sure which question you mean.\n"
+                            "List some questions first, e.g. 'list questions for Fungsi'.")
+                index = 0 if value > 0 else len(shown) - 1
+            else:
+                if session.position is None:
+                    # The current question was not listed; move within its topic
+                    question = kb.get_question_by_id(session.question_id)
+                    if not question:
+                        return f"Question with ID {session.question_id} no longer exists."
+                    shown = kb.get_questions_for_topic(question['TopicID'])
+                    session.show_questions(shown, question['TopicID'])
+                    session.view_question(question)
+                index = session.position + value
+                if not 0 <= index < len(shown):
+                    return f"That was the {'last' if value > 0 else 'first'} question in the list."
+        
+        question_id = shown[index]['QuestionID']
+        resolved = kb.resolve_question_id(question_id)
+        if not resolved:
+            return f"Question with ID {question_id} no longer exists."
+        return self.render_steps(kb, resolved, session, index)
+
+    def render_steps(self, kb, resolved, session, position=None):
+        """Worked solution of a (question ID, subquestion ID or None) pair"""
+        tree = kb.get_step_tree(resolved[0])
+        session.view_question(tree.question, position)
+        parts = tree.parts
+        if resolved[1]:
+            parts = [part for part in parts if part.subquestion['SubquestionID'] == resolved[1]]
+        
+        output = [f"\nQuestion {tree.question['QuestionID']}: {tree.question['Description']}"]
+        if tree.steps and not resolved[1]:
+            output.append("Steps:")
+            for i, step in enumerate(tree.steps, 1):
+                output.append(f"{i}. {step['Description']}")
+        
+        for part in parts:
+            subquestion = part.subquestion
+            output.append(f"\n{subquestion['SubquestionID']}: {subquestion['Description']}")
+            if part.steps:
+                output.append("Steps:")
+                for i, step in enumerate(part.steps, 1):
+                    output.append(f"{i}. {step['Description']}")
+            else:
+                output.append("No steps available for this part.")
+        
+        if not tree.steps and not parts:
+            output.append("No steps available for this question.")
+        
+        return "\n".join(output)
+
+    def handle_search(self, text, session=None):
+        """Handler for full-text search of questions and their steps"""
+        results = self.search(text)
+        if not results:
+            return (f"No questions mention '{text}'.\n"
+                    "Try fewer words, or type 'list topics' to browse by topic.")
+        return self.render_search_results(text, results, session or self.session)
+
+    def render_search_results(self, text, results, session):
+        kb = self.knowledge_base.snapshot
+        heading = f"Search results for '{text}':"
+        output = [f"\n{heading}", "-" * len(heading)]
+        shown = []
+        for _, question_id, subquestion_id in results:
+            question = kb.get_question_by_id(question_id)
+            if not question:
+                continue
+            topic = kb.get_topic(question['TopicID'])
+            topic_name = f" [{topic['TopicName']}]" if topic else ""
+            subquestion = kb.subquestions.get(subquestion_id) if subquestion_id else None
+            if subquestion:
+                output.append(f"ID: {subquestion_id} - {subquestion['Description']} "
+                              f"(part of question {question_id}){topic_name}")
+            else:
+                output.append(f"ID: {question_id} - {question['Description']}{topic_name}")
+            shown.append(question)
+        session.show_questions(shown)
+        output.append("\nTo see steps for a question, type 'show steps for question #'")
+        return "\n".join(output)
+
+    def handle_list_questions_for_topic(self, topic_query, session=None):
+        """Handler for listing questions for a specific topic"""
+        matched_topic = self.fuzzy_match_topic(topic_query)
+        
+        if not matched_topic:
+            matches = self.semantic_match(topic_query, 'topic', limit=1)
+            if matches:
+                matched_topic = (None, matches[0][0], matches[0][2])
+        
+        if not matched_topic:
+            return (f"I couldn't find the topic '{topic_query}'.\n"
+                    f"{self.did_you_mean(topic_query)}Please try another topic.")
+        
+        # Find topic details
+        kb = self.knowledge_base.snapshot
+        topic = kb.get_topic(matched_topic[2])
+                
+        if not topic:
+            return f"I couldn't find the topic '{topic_query}'. Please try another topic."
+        
+        (session or self.session).show_questions(kb.get_questions_for_topic(topic['TopicID']), topic['TopicID'])
+        return self.render_cached(kb, 'list_questions_for_topic', topic['TopicID'],
+                                  lambda kb: self.render_topic_questions(kb, topic))
+
+    def render_topic_questions(self, kb, topic):
+        """Questions of one topic"""
+        original_topic_name = topic['TopicName']
+        questions = kb.get_questions_for_topic(topic['TopicID'])
+        
+        output = [f"\nQuestions for {original_topic_name}:", 
+                  "-" * (len(f"Questions for {original_topic_name}:"))]
+        
+        if questions:
+            for question in questions:
+                output.append(f"ID: {question['QuestionID']} - {question['Description']}")
+            output.append("\nTo see steps for a question, type 'show steps for question #'")
+        else:
+            output.append("No questions available for this topic.")
+        
+        return "\n".join(output)
+
+    def handle_show_topic_info(self, normalized_query, session=None):
+        """Handler for showing information about a topic"""
+        # First try to match directly with the topics
+        matched_topic = self.fuzzy_match_topic(normalized_query)
+        
+        if not matched_topic:
+            # If no direct match, scan the query once for topic mentions
+            with self.metrics.stage('match'):
+                matched_topic = self.topic_index.find_in_text(normalized_query)
+                if not matched_topic:
+                    # Only correct the spelling once the words as typed match
+                    # nothing; correct words like 'panjang' are near topic
+                    # words ('janjang') too
+                    matched_topic = self.topic_index.find_in_text(self.correct_spelling(normalized_query))
+        
+        if not matched_topic:
+            # Closest topic or questions by meaning, in semantic mode
+            matches = self.semantic_match(normalized_query)
+            if matches and matches[0][1] == 'topic':
+                matched_topic = (None, matches[0][0], matches[0][2])
+            elif matches:
+                results = [(score, question_id, None) for score, kind, question_id in matches if kind == 'question']
+                return self.render_search_results(normalized_query, results, session or self.session)
+
+        if not matched_topic:
+            # Perhaps part of a problem was pasted rather than a topic name
+            results = self.search(normalized_query)
+            if results:
+                return self.render_search_results(normalized_query, results, session or self.session)
+            return ("I'm not sure what topic you're asking about.\n"
+                    f"{self.did_you_mean(normalized_query)}"
+                    "Type 'list topics' to see all available topics or 'help' for command assistance.")
+        
+        # The matched topic ID indexes straight into the knowledge base
+        kb = self.knowledge_base.snapshot
+        topic_details = kb.get_topic(matched_topic[2])
+        if not topic_details:
+            return ("Sorry, I couldn't find information about that topic.\n"
+                    "Try asking about a specific mathematics topic or type 'list topics' to see what's available.")
+
+        (session or self.session).show_questions(kb.get_questions_for_topic(topic_details['TopicID']),
+                                                 topic_details['TopicID'])
+        return self.render_cached(kb, 'show_topic_info', topic_details['TopicID'],
+                                  lambda kb: self.render_topic_info(kb, topic_details))
+
+    def render_topic_info(self, kb, topic_details):
+        """Formulas and sample questions of one topic"""
+        topic_id = topic_details['TopicID']
+        topic_name = topic_details['TopicName']
+
+        output = [f"\nTopic: {topic_name}", "-" * (len(f"Topic: {topic_name}"))]
+
+        # Retrieve and display formulas
+        formulas = kb.get_formulas_for_topic(topic_id)
+        if formulas:
+            output.append("\nFormulas:")
+            for formula in formulas:
+                output.append(f"- {formula['FormulaContent']}")
+
+        # Retrieve and display questions
+        questions = kb.get_questions_for_topic(topic_id)
+        
+        if questions:
+            output.append("\nSample Questions:")
+            for question in questions:
+                output.append(f"ID: {question['QuestionID']} - {question['Description']}")
+            output.append("\nTo see steps for a question, type 'show steps for question #'")
+        else:
+            output.append("\nNo questions available for this topic.")
+        
+        return "\n".join(output)
+
+    def answer_query(self, user_query, session=None):
+        """Route a raw user query to its handler and return the response text.
+
+        Follow-up questions are resolved against session, or the engine's
+        default session.
+
+        The number of database round trips the request needed is kept in
+        last_round_trips, and its stage timings in the engine's metrics.
+        """
+        return self.answer(user_query, session)[1]
+
+    def answer(self, user_query, session=None):
+        """Like answer_query(), but return (intent, response text); the
+        intent is None if the knowledge base could not be loaded"""
+        round_trips = self.backend.round_trips.current_thread()
+        self.metrics.begin_request()
+        with self.metrics.stage('total'):
+            intent, response = self._answer_query(user_query, session or self.session)
+        self.finish_request(user_query, intent, round_trips)
+        return intent, response
+
+    def _answer_query(self, user_query, session):
+        if not self.ensure_loaded():
+            return None, LOAD_ERROR
+        
+        normalized_query = normalize_input(user_query)
+        # Answers are only as current as the indexes that produced them; the
+        # snapshot may already be newer while a refresh updates them
+        version = self.indexed_version
+        cached = self.cached_answer(normalized_query, version, session)
+        if cached is not None:
+            return cached.intent, cached.response
+        intent, extra_args = self.route(normalized_query)
+        with self.metrics.stage('handler'):
+            if intent in UNCACHED_INTENTS:
+                return intent, INTENT_HANDLERS[intent](self, session, normalized_query, *extra_args)
+            with session.recording() as updates:
+                response = INTENT_HANDLERS[intent](self, session, normalized_query, *extra_args)
+        self.remember_answer(normalized_query, version, intent, response, updates)
+        return intent, response
+
+    def cached_answer(self, normalized_query, version, session):
+        """The memoized answer to a query, with its session updates applied
+        to session, or None"""
+        cached = self.answer_cache.get(normalized_query, version)
+        if cached is not None:
+            self.metrics.cache('answer_cache', True)
+            session.replay(cached.updates)
+        return cached
+
+    def remember_answer(self, normalized_query, version, intent, response, updates):
+        self.metrics.cache('answer_cache', False)
+        self.answer_cache.put(normalized_query, version, intent, response, updates)
+
+    def finish_request(self, user_query, intent, round_trips):
+        self.last_round_trips = self.backend.round_trips.current_thread() - round_trips
+        self.metrics.count('requests')
+        # Asking for the stats should not replace the request being diagnosed
+        breakdown = (self.metrics.end_request(user_query, intent, self.last_round_trips)
+                     if intent != 'stats' else None)
+        if breakdown:
+            logger.debug("Answered %r (%s) with %d database round trip(s), stages %s",
+                         user_query, intent, self.last_round_trips, breakdown['stages_ms'])
+        else:
+            logger.debug("Answered %r with %d database round trip(s)", user_query, self.last_round_trips)
+
+    def stream_query(self, user_query, session=None):
+        """Like answer_query(), but yield the response in chunks as it is
+        rendered, so long listings can be shown before they are complete"""
+        if not self.ensure_loaded():
+            yield LOAD_ERROR
+            return
+        
+        round_trips = self.backend.round_trips.current_thread()
+        self.metrics.begin_request()
+        with self.metrics.stage('total'):
+            intent = yield from self._stream_query(user_query, session or self.session)
+        self.finish_request(user_query, intent, round_trips)
+
+    def _stream_query(self, user_query, session):
+        """Yield the response chunks of a query; returns its intent"""
+        normalized_query = normalize_input(user_query)
+        version = self.indexed_version
+        cached = self.cached_answer(normalized_query, version, session)
+        if cached is not None:
+            yield cached.response
+            return cached.intent
+        intent, extra_args = self.route(normalized_query)
+        if intent in UNCACHED_INTENTS:
+            with self.metrics.stage('handler'):
+                response = INTENT_HANDLERS[intent](self, session, normalized_query, *extra_args)
+            yield response
+        elif intent in INTENT_STREAMS:
+            chunks = []
+            # Includes the time the consumer spends between chunks
+            with self.metrics.stage('stream'), session.recording() as updates:
+                for chunk in INTENT_STREAMS[intent](self, session, normalized_query, *extra_args):
+                    chunks.append(chunk)
+                    yield chunk
+            self.remember_answer(normalized_query, version, intent, "\n".join(chunks), updates)
+        else:
+            with self.metrics.stage('handler'), session.recording() as updates:
+                response = INTENT_HANDLERS[intent](self, session, normalized_query, *extra_args)
+            self.remember_answer(normalized_query, version, intent, response, updates)
+            yield response
+        return intent
+
+    def route(self, normalized_query):
+        """(intent, extracted arguments) of a normalized query"""
+        # Determine the user's intent
+        with self.metrics.stage('route'):
+            intent_result = determine_intent(normalized_query)
+        logger.debug("Determined intent: %s", intent_result)
+        
+        # Unpack the intent result
+        if isinstance(intent_result, tuple):
+            intent, *extra_args = intent_result
+        else:
+            intent = intent_result
+            extra_args = []
+        return intent, extra_args
+
+# Dispatch registry shared by the CLI and the GUI. Each handler receives the
+# engine, the session and the normalized query, followed by any arguments
+# the intent rule extracted.
+INTENT_HANDLERS = {
+    'help': lambda engine, session, normalized_query: show_help(),
+    'stats': lambda engine, session, normalized_query: engine.metrics.render_text(),
+    'list_all_questions': lambda engine, session, normalized_query, page=None:
+        engine.handle_list_all_questions(page, session),
+    'list_topics': lambda engine, session, normalized_query: engine.handle_list_topics(),
+    'search': lambda engine, session, normalized_query, text: engine.handle_search(text, session),
+    'follow_up': lambda engine, session, normalized_query, kind, value:
+        engine.handle_follow_up(kind, value, session),
+    'show_steps': lambda engine, session, normalized_query: engine.handle_show_steps(normalized_query, session),
+    'list_questions_for_topic': lambda engine, session, normalized_query, topic_query:
+        engine.handle_list_questions_for_topic(topic_query, session),
+    'show_topic_info': lambda engine, session, normalized_query:
+        engine.handle_show_topic_info(normalized_query, session),
+}
+
+# Intents whose responses depend on more than the query and the data, and
+# are never memoized: follow-ups resolve against the session, stats change
+# with every request
+UNCACHED_INTENTS = {'follow_up', 'stats'}
+
+# Intents whose responses can be long enough to be worth streaming
+INTENT_STREAMS = {
+    'list_all_questions': lambda engine, session, normalized_query, page=None:
+        engine.stream_all_questions(page, session),
+}
+
+def show_help():
+    """Display help information"""
+    return """
+==================================================
+ADDMATHS EXPERT SYSTEM - COMMAND GUIDE
+==================================================
+You can use these commands or natural language queries:
+
+1. TOPIC INFORMATION:
+   - Just type a topic name (e.g., 'Fungsi', 'Janjang')
+   - You'll get formulas and sample questions for that topic
+
+2. LIST COMMANDS:
+   - 'list topics' or 'show available topics'
+   - 'list questions for [topic]' (e.g., 'list questions for Fungsi')
+   - 'list all questions' or 'show all questions'
+   - 'list all questions page 2' - one page at a time
+
+3. QUESTION SOLUTIONS:
+   - 'show steps for question 5' or 'solution for q5'
+   - 'how to solve question 12' or 'steps for #12'
+   - 'steps for 10a' or 'steps for 10aii' for one part
+   - After a list: 'steps for the second one', 'next question'
+   - 'search f:x → 5 - 3x' - find questions by their text
+     (pasting part of a problem also works)
+
+4. OTHER COMMANDS:
+   - 'help' - Show this guide again
+   - 'stats' - Show response times and cache statistics
+   - 'exit' - Quit the program
+==================================================
+"""
@@ -3,432 +3,120 @@ from tkinter import scrolledtext, ttk, messagebox
 import threading
 import sys
 import io
-import mysql.connector
-from mysql.connector import pooling
-from dotenv import load_dotenv
 import os
-import re
-from fuzzywuzzy import process, fuzz
-import functools
-import logging
-from concurrent.futures import ThreadPoolExecutor
-from contextlib import contextmanager
-
-# Set up logging
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    filename='addmaths_ai.log'
-)
-logger = logging.getLogger('addmaths_ai')
-
-# Load environment variables once at startup
-try:
-    load_dotenv("C:/Users/User/AddmathsAI/AddmathsESKey.env")
-    logger.info("Environment variables loaded successfully")
-except Exception as e:
-    logger.error(f"Failed to load environment variables: {e}")
-
-# Constants
-FUZZY_MATCH_THRESHOLD = 50
-MAX_POOL_SIZE = 5
-DB_CONFIG = {
-    "host": "localhost",
-    "user": "root",
-    "password": "",
-    "database": "addmaths_es"
-}
-
-# Global caches
-topics_cache = {}
-questions_cache = {}
-
-# Create a connection pool
-try:
-    connection_pool = pooling.MySQLConnectionPool(
-        pool_name="addmaths_pool",
-        pool_size=MAX_POOL_SIZE,
-        **DB_CONFIG
-    )
-    logger.info("Database connection pool created successfully")
-except mysql.connector.Error as err:
-    logger.critical(f"Failed to create connection pool: {err}")
-    # Don't exit immediately, allow GUI to handle the error
-
-# Context manager for database connections
-@contextmanager
-def get_db_connection():
-    conn = connection_pool.get_connection()
-    try:
-        yield conn
-    finally:
-        conn.close()
-
-# Fetch data from the database with improved error handling
-def fetch_from_db(query, params=None):
-    try:
-        with get_db_connection() as conn:
-            cursor = conn.cursor(dictionary=True)
-            cursor.execute(query, params or ())
-            results = cursor.fetchall()
-            cursor.close()
-            return results
-    except mysql.connector.Error as err:
-        logger.error(f"Database error: {err}, Query: {query}, Params: {params}")
-        return []
-
-# Cache decorators with improved timeouts and error handling
-@functools.lru_cache(maxsize=32, typed=True)
-def get_all_topics():
-    logger.debug("Fetching all topics from database")
-    query = "SELECT TopicID, TopicName FROM topic"
-    results = fetch_from_db(query)
-    return results or []
-
-@functools.lru_cache(maxsize=128, typed=True)
-def get_all_questions():
-    logger.debug("Fetching all questions from database")
-    query = """
-    SELECT q.QuestionID, q.Description, t.TopicName 
-    FROM questions q
-    JOIN topic t ON q.TopicID = t.TopicID
-    ORDER BY t.TopicName, q.QuestionID
+import queue
+from collections import deque
+from addmaths_engine import (AddMathsEngine, Session, configure_logging, show_help, logger, LOAD_ERROR, normalize_input,
+                             determine_intent, UNCACHED_INTENTS)
+
+MAX_PENDING_COMMANDS = 4   # Queued commands beyond this drop the oldest
+OUTPUT_FLUSH_MS = 50       # Milliseconds between output queue drains
+OUTPUT_BATCH_LIMIT = 200   # Queued writes applied per drain at most
+MAX_SCROLLBACK_LINES = 5000
+
+class Command:
+    __slots__ = ('query', 'key', 'cancelled')
+
+    def __init__(self, query):
+        self.query = query
+        key = normalize_input(query)
+        intent = determine_intent(key)
+        # 'next question' twice must move twice, so queries whose answer
+        # depends on the session are never coalesced
+        self.key = None if (intent[0] if isinstance(intent, tuple) else intent) in UNCACHED_INTENTS else key
+        self.cancelled = False
+
+class CommandExecutor:
+    """Runs commands one at a time on a single worker thread.
+
+    A command identical to one already queued or running is coalesced into
+    it, unless its answer depends on the session. A new command supersedes
+    the running one, which stops at its next output chunk, and when more
+    than max_pending commands are waiting the oldest is cancelled. However
+    fast the user clicks, at most one query runs and uses a database
+    connection at a time.
     """
-    return fetch_from_db(query)
-
-@functools.lru_cache(maxsize=32, typed=True)
-def get_topic_details(topic_name):
-    query = "SELECT * FROM topic WHERE TopicName = %s"
-    topics = fetch_from_db(query, (topic_name,))
-    return topics[0] if topics else None
-
-@functools.lru_cache(maxsize=32, typed=True)
-def get_formulas_for_topic(topic_id):
-    query = "SELECT FormulaContent FROM formulas WHERE TopicID = %s"
-    return fetch_from_db(query, (topic_id,))
-
-@functools.lru_cache(maxsize=64, typed=True)
-def get_steps_for_question(question_id):
-    query = "SELECT Description FROM steps WHERE QuestionID = %s"
-    return fetch_from_db(query, (question_id,))
-
-@functools.lru_cache(maxsize=32, typed=True)
-def get_questions_for_topic(topic_id):
-    query = "SELECT QuestionID, Description FROM questions WHERE TopicID = %s"
-    return fetch_from_db(query, (topic_id,))
-
-@functools.lru_cache(maxsize=32, typed=True)
-def get_question_by_id(question_id):
-    query = "SELECT QuestionID, Description, TopicID FROM questions WHERE QuestionID = %s"
-    questions = fetch_from_db(query, (question_id,))
-    return questions[0] if questions else None
-
-# Clear all caches
-def clear_caches():
-    get_all_topics.cache_clear()
-    get_all_questions.cache_clear()
-    get_topic_details.cache_clear()
-    get_formulas_for_topic.cache_clear()
-    get_steps_for_question.cache_clear()
-    get_questions_for_topic.cache_clear()
-    get_question_by_id.cache_clear()
-    logger.info("All caches cleared")
-
-# Text processing utilities
-def normalize_input(user_input):
-    """Normalize and clean user input"""
-    return re.sub(r'\s+', ' ', user_input.strip().lower())
-
-def preprocess_topics(topics):
-    """Preprocess topics for faster matching"""
-    global topics_cache
-    topics_cache = {topic['TopicID']: topic['TopicName'].lower() for topic in topics}
-    logger.debug(f"Topics preprocessed: {len(topics_cache)} topics cached")
-
-def fuzzy_match_topic(user_query, topics_dict):
-    """Find the best matching topic using fuzzy logic"""
-    best_match = None
-    highest_score = 0
-    
-    for topic_id, topic_name in topics_dict.items():
-        score = fuzz.token_sort_ratio(user_query, topic_name)
-        if score > highest_score and score > FUZZY_MATCH_THRESHOLD:
-            highest_score = score
-            best_match = topic_name
-    
-    return (best_match, highest_score) if best_match else None
-
-# Pattern matching for user queries
-def extract_question_id(query_text):
-    """Extract question ID from input text"""
-    patterns = [
-        r'question\s+(\d+)',  # question 5
-        r'q\s*(\d+)',         # q5 or q 5
-        r'#\s*(\d+)',         # #5 or # 5
-        r'number\s+(\d+)',    # number 5
-        r'(\d+)',             # Just try to find any number as a fallback
-    ]
-    
-    for pattern in patterns:
-        match = re.search(pattern, query_text)
-        if match:
-            return int(match.group(1))
-    return None
-
-def determine_intent(user_query):
-    """Determine user intent from query"""
-    query = user_query.lower()
-    
-    # Intent for listing all questions
-    if any(phrase in query for phrase in ['all questions', 'every question', 'list all questions', 'show all questions', 
-                                         'all problems', 'every problem', 'all exercises']):
-        return "list_all_questions"
-    
-    # Intent for listing topics
-    if any(keyword in query for keyword in ['list topic', 'show topic', 'all topic', 'what topic', 'available topic']):
-        return "list_topics"
-    
-    # Intent for showing steps for a question
-    if any(keyword in query for keyword in ['step', 'solution', 'solve', 'how to']) and extract_question_id(query):
-        return "show_steps"
-    
-    # Intent for listing questions for a topic
-    list_questions_patterns = [
-        r'(list|show|get|what|give)\s+.*(questions|problems|exercises).*(?:for|on|about|in)\s+(.+)',
-        r'questions\s+(?:for|on|about|in)\s+(.+)',
-        r'problems\s+(?:for|on|about|in)\s+(.+)'
-    ]
-    
-    for pattern in list_questions_patterns:
-        match = re.search(pattern, query)
-        if match:
-            # If the pattern has 3 groups, the topic is in the 3rd group
-            # If it has fewer, the topic is in the last group
-            topic_group = match.group(3) if len(match.groups()) >= 3 else match.group(len(match.groups()))
-            return "list_questions_for_topic", topic_group.strip()
-    
-    # Default intent is to show topic information
-    return "show_topic_info"
-
-def extract_topic_from_query(query, pattern_type="questions"):
-    """Extract topic from user query"""
-    if pattern_type == "questions":
-        patterns = [
-            r'(?:questions|problems)\s+(?:for|on|about|in)\s+(.+)',
-            r'(?:list|show|get)\s+(?:questions|problems).*(?:for|on|about|in)\s+(.+)',
-            r'what\s+(?:questions|problems).*(?:for|on|about|in)\s+(.+)'
-        ]
-    else:
-        patterns = [r'(.+)']  # Fallback pattern to capture anything
-    
-    for pattern in patterns:
-        match = re.search(pattern, query)
-        if match:
-            return match.group(1).strip()
-    
-    return query  # Return the original query if no pattern matches
-
-# Command handlers
-def handle_list_all_questions():
-    """Handler for listing all questions"""
-    all_questions = get_all_questions()
-    
-    if not all_questions:
-        return "No questions available in the database."
-    
-    global questions_cache
-    questions_cache = {q['QuestionID']: q for q in all_questions}
-    
-    output = ["\nAll Available Questions:", "======================="]
-    current_topic = None
-    
-    for question in all_questions:
-        # Print topic header when topic changes
-        if current_topic != question['TopicName']:
-            current_topic = question['TopicName']
-            output.append(f"\n[{current_topic}]")
-        
-        output.append(f"ID: {question['QuestionID']} - {question['Description']}")
-    
-    output.append("\nTo see steps for any question, ask 'show steps for question #'")
-    return "\n".join(output)
-
-def handle_list_topics():
-    """Handler for listing all topics"""
-    all_topics = get_all_topics()
-    topic_names = [topic['TopicName'] for topic in all_topics]
-    
-    output = ["\nAvailable Topics:", "----------------"]
-    for name in topic_names:
-        output.append(f"- {name}")
-    
-    output.append("\nFor information on a topic, just type its name.")
-    output.append("To see questions for a topic, type 'list questions for [topic name]'")
-    
-    return "\n".join(output)
-
-def handle_show_steps(normalized_query):
-    """Handler for showing steps to solve a question"""
-    question_id = extract_question_id(normalized_query)
-    if not question_id:
-        return "I couldn't identify which question you're asking about. Please include a question number."
-    
-    question = get_question_by_id(question_id)
-    if not question:
-        return f"Question with ID {question_id} not found."
-    
-    steps = get_steps_for_question(question_id)
-    output = [f"\nQuestion {question_id}: {question['Description']}"]
-    
-    if steps:
-        output.append("Steps:")
-        for i, step in enumerate(steps, 1):
-            output.append(f"{i}. {step['Description']}")
-    else:
-        output.append("No steps available for this question.")
-    
-    return "\n".join(output)
-
-def handle_list_questions_for_topic(topic_query, all_topics):
-    """Handler for listing questions for a specific topic"""
-    matched_topic = fuzzy_match_topic(topic_query, topics_cache)
-    
-    if not matched_topic:
-        return f"I couldn't find the topic '{topic_query}'. Please try another topic."
-    
-    # Find topic details
-    original_topic_name = None
-    topic_id = None
-    
-    for topic in all_topics:
-        if topic['TopicName'].lower() == matched_topic[0]:
-            original_topic_name = topic['TopicName']
-            topic_id = topic['TopicID']
-            break
-            
-    if not original_topic_name:
-        return f"I couldn't find the topic '{topic_query}'. Please try another topic."
-    
-    questions = get_questions_for_topic(topic_id)
-    global questions_cache
-    questions_cache = {q['QuestionID']: q for q in questions}
-    
-    output = [f"\nQuestions for {original_topic_name}:", 
-              "-" * (len(f"Questions for {original_topic_name}:"))]
-    
-    if questions:
-        for question in questions:
-            output.append(f"ID: {question['QuestionID']} - {question['Description']}")
-        output.append("\nTo see steps for a question, type 'show steps for question #'")
-    else:
-        output.append("No questions available for this topic.")
-    
-    return "\n".join(output)
-
-def handle_show_topic_info(normalized_query, all_topics):
-    """Handler for showing information about a topic"""
-    # First try to match directly with the topics
-    matched_topic = fuzzy_match_topic(normalized_query, topics_cache)
-    
-    if not matched_topic:
-        # If no direct match, try to extract potential topic mentions
-        words = re.findall(r'\b\w+\b', normalized_query)
-        for i in range(len(words)):
-            for j in range(i + 1, min(i + 5, len(words) + 1)):  # Look at phrases up to 4 words long
-                phrase = ' '.join(words[i:j])
-                if len(phrase) > 2:  # Only consider phrases longer than 2 characters
-                    potential_match = fuzzy_match_topic(phrase, topics_cache)
-                    if potential_match and (not matched_topic or potential_match[1] > matched_topic[1]):
-                        matched_topic = potential_match
-    
-    if not matched_topic:
-        return ("I'm not sure what topic you're asking about.\n"
-                "Type 'list topics' to see all available topics or 'help' for command assistance.")
-    
-    # Find the original topic name from the matched lowercase name
-    original_topic_name = None
-    for topic in all_topics:
-        if topic['TopicName'].lower() == matched_topic[0]:
-            original_topic_name = topic['TopicName']
-            break
-            
-    if not original_topic_name:
-        return ("Sorry, I couldn't find information about that topic.\n"
-                "Try asking about a specific mathematics topic or type 'list topics' to see what's available.")
-    
-    # Fetch detailed info on the matched topic
-    topic_details = get_topic_details(original_topic_name)
-    if not topic_details:
-        return "Sorry, I couldn't find information about that topic."
-
-    topic_id = topic_details['TopicID']
-    topic_name = topic_details['TopicName']
-
-    output = [f"\nTopic: {topic_name}", "-" * (len(f"Topic: {topic_name}"))]
-
-    # Retrieve and display formulas
-    formulas = get_formulas_for_topic(topic_id)
-    if formulas:
-        output.append("\nFormulas:")
-        for formula in formulas:
-            output.append(f"- {formula['FormulaContent']}")
-
-    # Retrieve and display questions
-    questions = get_questions_for_topic(topic_id)
-    
-    # Save questions to cache for reference
-    global questions_cache
-    questions_cache = {q['QuestionID']: q for q in questions}
-    
-    if questions:
-        output.append("\nSample Questions:")
-        for question in questions:
-            output.append(f"ID: {question['QuestionID']} - {question['Description']}")
-        output.append("\nTo see steps for a question, type 'show steps for question #'")
-    else:
-        output.append("\nNo questions available for this topic.")
-    
-    return "\n".join(output)
-
-def show_help():
-    """Display help information"""
-    return """
-==================================================
-ADDMATHS EXPERT SYSTEM - COMMAND GUIDE
-==================================================
-You can use these commands or natural language queries:
 
-1. TOPIC INFORMATION:
-   - Just type a topic name (e.g., 'Fungsi', 'Janjang')
-   - You'll get formulas and sample questions for that topic
-
-2. LIST COMMANDS:
-   - 'list topics' or 'show available topics'
-   - 'list questions for [topic]' (e.g., 'list questions for Fungsi')
-   - 'list all questions' or 'show all questions'
-
-3. QUESTION SOLUTIONS:
-   - 'show steps for question 5' or 'solution for q5'
-   - 'how to solve question 12' or 'steps for #12'
-
-4. OTHER COMMANDS:
-   - 'help' - Show this guide again
-   - 'exit' - Quit the program
-==================================================
-"""
+    def __init__(self, run, max_pending=MAX_PENDING_COMMANDS, on_cancelled=None):
+        self.run = run
+        self.max_pending = max_pending
+        self.on_cancelled = on_cancelled
+        self.current = None
+        self._pending = deque()
+        self._condition = threading.Condition()
+        self._closed = False
+        self._worker = threading.Thread(target=self._work, name="addmaths-commands", daemon=True)
+        self._worker.start()
+
+    def submit(self, query):
+        """Queue a command; returns it, or None if it was coalesced"""
+        command = Command(query)
+        with self._condition:
+            if self._closed:
+                return None
+            if command.key is not None and any(other.key == command.key and not other.cancelled
+                                               for other in [self.current, *self._pending] if other):
+                logger.debug("Coalesced duplicate command: %s", query)
+                return None
+            if self.current:
+                self.current.cancelled = True
+            if len(self._pending) >= self.max_pending:
+                dropped = self._pending.popleft()
+                dropped.cancelled = True
+                logger.info("Dropped queued command: %s", dropped.query)
+                if self.on_cancelled:
+                    self.on_cancelled(dropped)
+            self._pending.append(command)
+            self._condition.notify()
+        return command
+
+    def _work(self):
+        while True:
+            with self._condition:
+                while not self._pending and not self._closed:
+                    self._condition.wait()
+                if self._closed:
+                    return
+                command = self.current = self._pending.popleft()
+            try:
+                self.run(command)
+            except Exception as e:
+                logger.error("Error running command '%s': %s", command.query, e, exc_info=True)
+            finally:
+                with self._condition:
+                    self.current = None
+
+    def shutdown(self):
+        with self._condition:
+            self._closed = True
+            if self.current:
+                self.current.cancelled = True
+            for command in self._pending:
+                command.cancelled = True
+            self._pending.clear()
+            self._condition.notify_all()
 
 # GUI Application Class
 class AddMathsGUI(tk.Tk):
-    def __init__(self):
+    def __init__(self, engine=None, scrollback_lines=MAX_SCROLLBACK_LINES):
         super().__init__()
+        self.engine = engine or AddMathsEngine()
+        self.session = Session()
+        self.scrollback_lines = scrollback_lines
+        
+        # Any thread may queue output; only the Tk thread touches widgets
+        self.output_queue = queue.Queue()
         self.title("AddMaths Expert System")
         self.geometry("800x600")
         self.iconbitmap("math_icon.ico") if os.path.exists("math_icon.ico") else None
         self.configure(bg="#f0f0f0")
-        self.all_topics = []
+        
+        # Every query runs on one worker thread, never on the Tk thread
+        self.executor = CommandExecutor(self.execute_command, on_cancelled=self.report_cancelled)
         
         self.create_widgets()
         self.setup_styles()
+        self.drain_job = self.after(OUTPUT_FLUSH_MS, self.drain_output)
         
         # Initialize system in a separate thread
         self.init_thread = threading.Thread(target=self.initialize_system)
@@ -484,13 +172,13 @@ class AddMathsGUI(tk.Tk):
         self.quick_frame = ttk.Frame(self.main_frame)
         self.quick_frame.pack(fill=tk.X, padx=5, pady=(0, 5))
         
-        self.help_button = ttk.Button(self.quick_frame, text="Help", command=lambda: self.execute_command("help"))
+        self.help_button = ttk.Button(self.quick_frame, text="Help", command=lambda: self.submit_command("help"))
         self.help_button.pack(side=tk.LEFT, padx=2)
         
-        self.topics_button = ttk.Button(self.quick_frame, text="List Topics", command=lambda: self.execute_command("list topics"))
+        self.topics_button = ttk.Button(self.quick_frame, text="List Topics", command=lambda: self.submit_command("list topics"))
         self.topics_button.pack(side=tk.LEFT, padx=2)
         
-        self.questions_button = ttk.Button(self.quick_frame, text="All Questions", command=lambda: self.execute_command("list all questions"))
+        self.questions_button = ttk.Button(self.quick_frame, text="All Questions", command=lambda: self.submit_command("list all questions"))
         self.questions_button.pack(side=tk.LEFT, padx=2)
         
         self.clear_button = ttk.Button(self.quick_frame, text="Clear", command=self.clear_output)
@@ -507,19 +195,16 @@ class AddMathsGUI(tk.Tk):
     def initialize_system(self):
         try:
             # Update status
-            self.status_var.set("Loading topics from database...")
+            self.set_status("Loading knowledge base from database...")
             
-            # Fetch all topics from the database
-            self.all_topics = get_all_topics()
-            if not self.all_topics:
-                self.write_to_output("Error: Unable to load topics from database. Please check your connection.")
-                self.status_var.set("Error: Database connection failed")
+            # Load the whole knowledge base into memory once
+            if not self.engine.ensure_loaded():
+                self.write_to_output(LOAD_ERROR)
+                self.set_status("Error: Database connection failed")
                 return
             
-            preprocess_topics(self.all_topics)
-            
             # Ready
-            self.status_var.set("Ready")
+            self.set_status("Ready")
             
             # Show welcome message and help
             welcome_message = "\n" + "="*60 + "\n"
@@ -532,15 +217,46 @@ class AddMathsGUI(tk.Tk):
             self.write_to_output(show_help())
             
         except Exception as e:
-            logger.critical(f"Fatal error during startup: {e}")
+            logger.critical("Fatal error during startup: %s", e)
             self.write_to_output(f"Error: Unable to initialize the expert system.\nDetails: {e}")
-            self.status_var.set("Initialization failed")
+            self.set_status("Initialization failed")
     
     def write_to_output(self, text):
-        self.output_text.config(state=tk.NORMAL)
-        self.output_text.insert(tk.END, text + "\n")
-        self.output_text.see(tk.END)
-        self.output_text.config(state=tk.DISABLED)
+        """Queue text for the output pane; safe to call from any thread"""
+        self.output_queue.put(('text', text))
+    
+    def set_status(self, text):
+        """Queue a status bar update; safe to call from any thread"""
+        self.output_queue.put(('status', text))
+    
+    def drain_output(self):
+        """Apply queued output on the Tk thread, one insert per batch, then
+        trim the pane to the scrollback limit"""
+        texts = []
+        status = None
+        try:
+            for _ in range(OUTPUT_BATCH_LIMIT):
+                kind, text = self.output_queue.get_nowait()
+                if kind == 'text':
+                    texts.append(text + "\n")
+                else:
+                    status = text
+        except queue.Empty:
+            pass
+        
+        if texts:
+            self.output_text.config(state=tk.NORMAL)
+            self.output_text.insert(tk.END, "".join(texts))
+            # The pane always ends with one empty line after the last newline
+            excess = int(self.output_text.index('end-1c').split('.')[0]) - 1 - self.scrollback_lines
+            if excess > 0:
+                self.output_text.delete('1.0', f'{excess + 1}.0')
+            self.output_text.see(tk.END)
+            self.output_text.config(state=tk.DISABLED)
+        if status is not None:
+            self.status_var.set(status)
+        
+        self.drain_job = self.after(OUTPUT_FLUSH_MS, self.drain_output)
     
     def clear_output(self):
         self.output_text.config(state=tk.NORMAL)
@@ -563,67 +279,43 @@ class AddMathsGUI(tk.Tk):
             self.on_closing()
             return
         
-        # Process in a separate thread to avoid UI freeze
-        threading.Thread(target=self.execute_command, args=(user_query,), daemon=True).start()
+        # Process on the worker thread to avoid UI freeze
+        self.submit_command(user_query)
+    
+    def submit_command(self, user_query):
+        if self.executor.submit(user_query) is None:
+            self.set_status("Already working on that request...")
     
-    def execute_command(self, user_query):
+    def report_cancelled(self, command):
+        self.write_to_output(f"(Skipped '{command.query}': too many requests waiting)")
+    
+    def execute_command(self, command):
+        user_query = command.query
         try:
-            self.status_var.set("Processing...")
+            self.set_status("Processing...")
             
             # If topics not loaded yet, show error
-            if not self.all_topics:
+            if not self.engine.ready:
                 self.write_to_output("System is still initializing. Please wait...")
-                self.status_var.set("Still initializing...")
-                return
-            
-            # Process help command directly
-            if user_query.lower() == "help":
-                self.write_to_output(show_help())
-                self.status_var.set("Ready")
+                self.set_status("Still initializing...")
                 return
             
-            # Normalize and process user input
-            normalized_query = normalize_input(user_query)
-            
-            # Determine the user's intent
-            intent_result = determine_intent(normalized_query)
-            
-            # Unpack the intent result
-            if isinstance(intent_result, tuple):
-                intent, *extra_args = intent_result
-            else:
-                intent = intent_result
-                extra_args = []
-
-            # Handle different intents
-            response = None
-            
-            if intent == "list_all_questions":
-                response = handle_list_all_questions()
-                
-            elif intent == "list_topics":
-                response = handle_list_topics()
-                
-            elif intent == "show_steps":
-                response = handle_show_steps(normalized_query)
-                
-            elif intent == "list_questions_for_topic":
-                topic_query = extra_args[0] if extra_args else extract_topic_from_query(normalized_query)
-                response = handle_list_questions_for_topic(topic_query, self.all_topics)
-                
-            elif intent == "show_topic_info":
-                response = handle_show_topic_info(normalized_query, self.all_topics)
-            
-            # Display the response
-            if response:
-                self.write_to_output(response)
+            # Route the query through the shared intent handlers, showing
+            # long listings chunk by chunk as they are rendered; a superseded
+            # listing stops before its next chunk
+            for index, chunk in enumerate(self.engine.stream_query(user_query, self.session)):
+                if index and command.cancelled:
+                    self.write_to_output("(Stopped: superseded by a newer request)")
+                    break
+                if chunk:
+                    self.write_to_output(chunk)
                 
-            self.status_var.set("Ready")
+            self.set_status("Ready")
             
         except Exception as e:
-            logger.error(f"Error processing query '{user_query}': {e}", exc_info=True)
+            logger.error("Error processing query '%s': %s", user_query, e, exc_info=True)
             self.write_to_output(f"Sorry, an error occurred: {e}")
-            self.status_var.set("Error occurred")
+            self.set_status("Error occurred")
     
     def write(self, text):
         """Required for stdout redirection"""
@@ -637,8 +329,10 @@ class AddMathsGUI(tk.Tk):
         # Restore stdout
         sys.stdout = self.old_stdout
         
-        # Clear caches
-        clear_caches()
+        # Stop the command worker, output drain, background refresh and clear caches
+        self.executor.shutdown()
+        self.after_cancel(self.drain_job)
+        self.engine.close()
         
         # Close window
         self.destroy()
@@ -648,13 +342,15 @@ class AddMathsGUI(tk.Tk):
 
 # Entry point
 if __name__ == "__main__":
+    configure_logging()
+    engine = AddMathsEngine()
     try:
-        app = AddMathsGUI()
+        app = AddMathsGUI(engine)
         app.mainloop()
     except Exception as e:
-        logger.critical(f"Fatal error in GUI application: {e}", exc_info=True)
+        logger.critical("Fatal error in GUI application: %s", e, exc_info=True)
         messagebox.showerror("Fatal Error", f"A critical error occurred: {e}\nPlease check the log file for details.")
     finally:
         # Clean up resources
-        clear_caches()
+        engine.close()
         logger.info("Application shutdown complete")
\ No newline at end of file
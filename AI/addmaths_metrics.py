@@ -0,0 +1,204 @@
+"""Latency and cache statistics for the AddMaths expert system.
+
+The engine times each stage of a request (intent routing, topic matching,
+handlers, rendering, database queries and pool waits) and counts hits and
+misses of its caches in a Metrics object. The 'stats' command shows them,
+and start_dump() writes them periodically to a JSON or Prometheus text file.
+
+Metrics(enabled=False), or ADDMATHS_STATS=0, turns every timer into a shared
+no-op context manager and every counter into an early return.
+"""
+import json
+import os
+import threading
+import time
+import logging
+
+logger = logging.getLogger('addmaths_ai')
+
+STATS_DUMP_INTERVAL = 60   # Seconds between stats file dumps
+
+
+class StageTimer:
+    __slots__ = ('metrics', 'name', 'start')
+
+    def __init__(self, metrics, name):
+        self.metrics = metrics
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.metrics.record(self.name, time.perf_counter() - self.start)
+        return False
+
+
+class NullTimer:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+
+NULL_TIMER = NullTimer()
+
+
+class Metrics:
+    """Per-stage latency totals and cache hit/miss counters.
+
+    Stages may nest (a handler's time includes the topic matching and
+    rendering it does), so stage totals do not add up to the request total.
+    The stages of the request in progress on each thread are also collected,
+    and the last finished request's breakdown is kept for the stats command.
+    """
+
+    def __init__(self, enabled=None):
+        if enabled is None:
+            enabled = os.environ.get('ADDMATHS_STATS', '1') != '0'
+        self.enabled = enabled
+        self.started = time.time()
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self.stages = {}      # name -> [count, total seconds, max seconds]
+        self.counters = {}
+        self.last_request = None
+        self._dump_thread = None
+        self._dump_stop = threading.Event()
+
+    def stage(self, name):
+        """Context manager timing one stage of the current request"""
+        return StageTimer(self, name) if self.enabled else NULL_TIMER
+
+    def record(self, name, seconds):
+        with self._lock:
+            stats = self.stages.get(name)
+            if stats is None:
+                self.stages[name] = [1, seconds, seconds]
+            else:
+                stats[0] += 1
+                stats[1] += seconds
+                if seconds > stats[2]:
+                    stats[2] = seconds
+        current = getattr(self._local, 'request', None)
+        if current is not None:
+            current[name] = current.get(name, 0.0) + seconds
+
+    def count(self, name, amount=1):
+        if not self.enabled:
+            return
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + amount
+
+    def cache(self, name, hit):
+        """Count a hit or a miss of the named cache"""
+        if self.enabled:
+            self.count(f"{name}_{'hits' if hit else 'misses'}")
+
+    def begin_request(self):
+        if self.enabled:
+            self._local.request = {}
+
+    def end_request(self, query, intent, round_trips):
+        """Close the current thread's request and keep its stage breakdown"""
+        if not self.enabled:
+            return None
+        stages = getattr(self._local, 'request', None) or {}
+        self._local.request = None
+        self.last_request = {'query': query, 'intent': intent, 'round_trips': round_trips,
+                             'stages_ms': {name: round(seconds * 1000, 3) for name, seconds in stages.items()}}
+        return self.last_request
+
+    def snapshot(self):
+        """All statistics as a JSON-serializable dict"""
+        with self._lock:
+            stages = {name: {'count': count, 'total_ms': round(total * 1000, 3),
+                             'mean_ms': round(total * 1000 / count, 3), 'max_ms': round(peak * 1000, 3)}
+                      for name, (count, total, peak) in sorted(self.stages.items())}
+            counters = dict(sorted(self.counters.items()))
+        caches = {}
+        for name in counters:
+            if name.endswith('_hits') or name.endswith('_misses'):
+                cache = name.rsplit('_', 1)[0]
+                hits = counters.get(f"{cache}_hits", 0)
+                total = hits + counters.get(f"{cache}_misses", 0)
+                caches[cache] = round(hits / total, 4) if total else None
+        return {'enabled': self.enabled, 'uptime_s': round(time.time() - self.started, 1), 'stages': stages,
+                'counters': counters, 'cache_hit_rates': caches, 'last_request': self.last_request}
+
+    def render_text(self):
+        """Human-readable statistics for the stats command"""
+        if not self.enabled:
+            return "Statistics are disabled (set ADDMATHS_STATS=1 to enable them)."
+        stats = self.snapshot()
+        output = ["\nSystem Statistics:", "------------------", f"Uptime: {stats['uptime_s']:.0f} s"]
+        if stats['stages']:
+            output.append("\nStage latency (count, mean ms, max ms):")
+            for name, stage in stats['stages'].items():
+                output.append(f"- {name}: {stage['count']}, {stage['mean_ms']:.3f}, {stage['max_ms']:.3f}")
+        if stats['cache_hit_rates']:
+            output.append("\nCache hit rates:")
+            for name, rate in stats['cache_hit_rates'].items():
+                hits = stats['counters'].get(f"{name}_hits", 0)
+                misses = stats['counters'].get(f"{name}_misses", 0)
+                output.append(f"- {name}: {rate:.1%} ({hits} hits, {misses} misses)")
+        others = {name: value for name, value in stats['counters'].items()
+                  if not name.endswith('_hits') and not name.endswith('_misses')}
+        if others:
+            output.append("\nCounters:")
+            for name, value in others.items():
+                output.append(f"- {name}: {value}")
+        last = stats['last_request']
+        if last:
+            output.append(f"\nLast request: {last['query']!r} ({last['intent']}, "
+                          f"{last['round_trips']} database round trip(s))")
+            for name, ms in last['stages_ms'].items():
+                output.append(f"- {name}: {ms:.3f} ms")
+        return "\n".join(output)
+
+    def to_prometheus(self):
+        """Statistics in the Prometheus text exposition format"""
+        stats = self.snapshot()
+        lines = ["# TYPE addmaths_stage_seconds_total counter",
+                 "# TYPE addmaths_stage_calls_total counter",
+                 "# TYPE addmaths_stage_max_seconds gauge"]
+        for name, stage in stats['stages'].items():
+            lines.append(f'addmaths_stage_seconds_total{{stage="{name}"}} {stage["total_ms"] / 1000}')
+            lines.append(f'addmaths_stage_calls_total{{stage="{name}"}} {stage["count"]}')
+            lines.append(f'addmaths_stage_max_seconds{{stage="{name}"}} {stage["max_ms"] / 1000}')
+        lines.append("# TYPE addmaths_events_total counter")
+        for name, value in stats['counters'].items():
+            lines.append(f'addmaths_events_total{{event="{name}"}} {value}')
+        return "\n".join(lines) + "\n"
+
+    def dump(self, path):
+        """Write the statistics to path, as Prometheus text if it ends in
+        .prom and as JSON otherwise; the file is replaced atomically"""
+        text = self.to_prometheus() if path.endswith('.prom') else json.dumps(self.snapshot(), indent=2)
+        temporary = f"{path}.tmp"
+        with open(temporary, 'w', encoding='utf8') as output:
+            output.write(text)
+        os.replace(temporary, path)
+
+    def _dump_loop(self, path, interval):
+        while not self._dump_stop.wait(interval):
+            try:
+                self.dump(path)
+            except OSError as e:
+                logger.error("Failed to write statistics to %s: %s", path, e)
+
+    def start_dump(self, path, interval=STATS_DUMP_INTERVAL):
+        """Dump the statistics to path every interval seconds on a background thread"""
+        if not self.enabled or (self._dump_thread and self._dump_thread.is_alive()):
+            return
+        self._dump_stop.clear()
+        self._dump_thread = threading.Thread(target=self._dump_loop, args=(path, interval),
+                                             name="stats-dump", daemon=True)
+        self._dump_thread.start()
+
+    def stop_dump(self):
+        self._dump_stop.set()
@@ -0,0 +1,649 @@
+"""Storage backends for the AddMaths expert system.
+
+A backend runs the engine's SQL (written with %s placeholders). query()
+returns every row at once as dicts; stream() yields rows in chunks as the
+database sends them, built by a row type (namedtuples by default, or any
+class taking the column values). Two backends are provided:
+
+- MySQLBackend: the addmaths_es MySQL database, through a ConnectionPool
+  created on first use that grows and shrinks with demand.
+- SQLiteBackend: an embedded database file built once from
+  Database/ES_AddmathsDump.sql and queried in-process, with no server and
+  no socket round trips. It is rebuilt automatically when the dump changes.
+
+Pick one with create_backend(), or the ADDMATHS_BACKEND environment
+variable ("mysql" or "sqlite"). Running this file builds the embedded
+database: python addmaths_storage.py [dump.sql] [database.sqlite3]
+"""
+import os
+import re
+import random
+import sqlite3
+import threading
+import time
+import zlib
+from collections import OrderedDict, deque, namedtuple
+import logging
+from addmaths_metrics import Metrics
+
+logger = logging.getLogger('addmaths_ai')
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+DUMP_FILE = os.path.join(BASE_DIR, '..', 'Database', 'ES_AddmathsDump.sql')
+SQLITE_FILE = os.path.join(BASE_DIR, '..', 'Database', 'addmaths_es.sqlite3')
+POOL_MIN_SIZE = 1              # Idle connections kept open however quiet it gets
+POOL_TIMEOUT = float(os.environ.get('ADDMATHS_POOL_TIMEOUT', 5))  # Seconds to wait for a free connection
+POOL_IDLE_TIMEOUT = 300        # Seconds before an idle connection above the minimum is closed
+POOL_VALIDATE_AFTER = 30       # Idle seconds after which a connection is pinged before reuse
+CONNECT_BACKOFF = 0.1          # First delay between failed connection attempts...
+CONNECT_BACKOFF_MAX = 5.0      # ...doubling up to this
+STREAM_FETCH_SIZE = 500        # Rows per chunk yielded by stream()
+PREPARED_CACHE_SIZE = 32       # Prepared statements kept per MySQL connection
+
+
+# Row types for stream() take the column names and return a function
+# building one row from a tuple of values
+_named_row_classes = {}
+
+
+def named_rows(columns):
+    """Namedtuple rows: tuple-sized, with fields readable by name"""
+    columns = tuple(columns)
+    row_class = _named_row_classes.get(columns)
+    if row_class is None:
+        row_class = _named_row_classes[columns] = namedtuple('Row', columns, rename=True)
+    return row_class._make
+
+
+def chunked(cursor, row_type, chunk_size):
+    """Yield lists of up to chunk_size rows from an executed cursor"""
+    make_row = row_type([column[0] for column in cursor.description])
+    while True:
+        rows = cursor.fetchmany(chunk_size)
+        if not rows:
+            return
+        yield [make_row(row) for row in rows]
+
+
+class RoundTripCounter:
+    """Counts queries sent to the database, in total and per thread"""
+
+    def __init__(self):
+        self.total = 0
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    def record(self):
+        with self._lock:
+            self.total += 1
+        self._local.count = getattr(self._local, 'count', 0) + 1
+
+    def current_thread(self):
+        return getattr(self._local, 'count', 0)
+
+
+class PoolTimeout(Exception):
+    """No database connection became free within the pool's wait timeout"""
+
+
+class ConnectionPool:
+    """Thread-safe pool of database connections, opened on demand.
+
+    acquire() reuses the most recently released idle connection, pinging it
+    first if it sat idle longer than validate_after; opens a new one while
+    fewer than max_size are open; and otherwise waits up to timeout for a
+    release before raising PoolTimeout. Failed connects are retried with
+    exponential backoff until the same deadline. Connections idle longer
+    than idle_timeout are closed, down to min_size, whenever a connection
+    is acquired or released, or when reap() is called.
+
+    Waits, timeouts, connects, failures and discarded connections are
+    counted in metrics as pool_* counters.
+    """
+
+    def __init__(self, connect, is_alive, min_size=POOL_MIN_SIZE, max_size=5, timeout=POOL_TIMEOUT,
+                 idle_timeout=POOL_IDLE_TIMEOUT, validate_after=POOL_VALIDATE_AFTER, metrics=None):
+        self.connect = connect
+        self.is_alive = is_alive
+        self.min_size = min(min_size, max_size)
+        self.max_size = max_size
+        self.timeout = timeout
+        self.idle_timeout = idle_timeout
+        self.validate_after = validate_after
+        self.metrics = metrics or Metrics(enabled=False)
+        self.size = 0          # Open connections, idle or in use, and connects in progress
+        self.idle = deque()    # (connection, monotonic release time), oldest first
+        self.closed = False
+        self._condition = threading.Condition()
+
+    def acquire(self, timeout=None):
+        deadline = time.monotonic() + (self.timeout if timeout is None else timeout)
+        # Before the server's wait_timeout can drop them, and before one of
+        # them is picked for reuse
+        self.reap()
+        while True:
+            conn, idle_since = self._reserve(deadline)
+            if conn is None:
+                return self._open(deadline)
+            if time.monotonic() - idle_since <= self.validate_after or self.is_alive(conn):
+                return conn
+            self.metrics.count('pool_stale_connections')
+            logger.warning("Discarding a dead pooled database connection")
+            self.discard(conn)
+
+    def _reserve(self, deadline):
+        """An idle (connection, release time), or (None, None) once a slot
+        for a new connection is reserved"""
+        with self._condition:
+            waited = False
+            while True:
+                if self.idle:
+                    return self.idle.pop()
+                if self.size < self.max_size:
+                    self.size += 1
+                    return None, None
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self.metrics.count('pool_timeouts')
+                    raise PoolTimeout(f"All {self.max_size} database connections are busy")
+                if not waited:
+                    waited = True
+                    self.metrics.count('pool_waits')
+                self._condition.wait(remaining)
+
+    def _open(self, deadline):
+        delay = CONNECT_BACKOFF
+        while True:
+            try:
+                conn = self.connect()
+            except Exception as e:
+                self.metrics.count('pool_connect_failures')
+                if time.monotonic() + delay >= deadline:
+                    with self._condition:
+                        self.size -= 1
+                        self._condition.notify()
+                    raise
+                logger.warning("Database connection failed, retrying in %.1f s: %s", delay, e)
+                time.sleep(delay * random.uniform(0.5, 1.0))
+                delay = min(delay * 2, CONNECT_BACKOFF_MAX)
+                continue
+            self.metrics.count('pool_connects')
+            return conn
+
+    def release(self, conn):
+        if self.closed:
+            self.discard(conn)
+            return
+        with self._condition:
+            self.idle.append((conn, time.monotonic()))
+            self._condition.notify()
+        self.reap()
+
+    def reap(self):
+        """Close the connections idle longer than idle_timeout, down to min_size"""
+        now = time.monotonic()
+        expired = []
+        with self._condition:
+            while self.idle and self.size > self.min_size and now - self.idle[0][1] > self.idle_timeout:
+                expired.append(self.idle.popleft()[0])
+                self.size -= 1
+        for conn in expired:
+            self.metrics.count('pool_idle_closed')
+            self._close(conn)
+
+    def discard(self, conn):
+        """Close a broken connection, freeing its slot"""
+        with self._condition:
+            self.size -= 1
+            self._condition.notify()
+        self._close(conn)
+
+    def _close(self, conn):
+        try:
+            conn.close()
+        except Exception as e:
+            logger.debug("Error closing database connection: %s", e)
+
+    def close(self):
+        """Close the idle connections; ones in use are closed as they are released"""
+        self.closed = True
+        with self._condition:
+            idle = [conn for conn, _ in self.idle]
+            self.idle.clear()
+            self.size -= len(idle)
+        for conn in idle:
+            self._close(conn)
+
+
+class MySQLBackend:
+    """The addmaths_es MySQL database behind a lazily created connection pool.
+
+    A query that fails because its connection dropped is retried once on a
+    fresh connection; every other failure, including PoolTimeout, is raised.
+    """
+
+    name = 'mysql'
+
+    def __init__(self, db_config, pool_size, env_file=None, min_pool_size=POOL_MIN_SIZE):
+        self.db_config = dict(db_config)
+        self.pool_size = pool_size
+        self.min_pool_size = min_pool_size
+        self.env_file = env_file
+        self._pool = None
+        self._pool_lock = threading.Lock()
+        self.round_trips = RoundTripCounter()
+        self.metrics = Metrics(enabled=False)
+
+    @property
+    def Error(self):
+        import mysql.connector
+        return mysql.connector.Error
+
+    # Create the connection pool on first use
+    def get_pool(self):
+        if self._pool is None:
+            with self._pool_lock:
+                if self._pool is None:
+                    if self.env_file:
+                        load_environment(self.env_file)
+                    self._pool = ConnectionPool(self.connect, self.is_alive, self.min_pool_size, self.pool_size,
+                                                metrics=self.metrics)
+                    logger.info("Database connection pool created (%d to %d connections)",
+                                self._pool.min_size, self._pool.max_size)
+        return self._pool
+
+    def connect(self):
+        import mysql.connector
+        # Autocommit, so a reused connection never reads from an old snapshot
+        conn = mysql.connector.connect(autocommit=True, **self.db_config)
+        # MySQL 8 caches information_schema table statistics for a day by
+        # default, which would hide UPDATE_TIME changes from table_versions()
+        cursor = conn.cursor()
+        try:
+            cursor.execute("SET SESSION information_schema_stats_expiry = 0")
+        except mysql.connector.Error:
+            pass  # Older servers do not cache them
+        finally:
+            cursor.close()
+        return conn
+
+    @staticmethod
+    def is_alive(conn):
+        import mysql.connector
+        try:
+            conn.ping(reconnect=False)
+            return True
+        except mysql.connector.Error:
+            return False
+
+    def query(self, query, params=None):
+        from mysql.connector import errors
+        self.round_trips.record()
+        pool = self.get_pool()
+        for attempt in (1, 2):
+            with self.metrics.stage('pool_wait'):
+                conn = pool.acquire()
+            try:
+                with self.metrics.stage('db'):
+                    cursor = conn.cursor(dictionary=True)
+                    cursor.execute(query, params or ())
+                    results = cursor.fetchall()
+                    cursor.close()
+            except (errors.OperationalError, errors.InterfaceError) as e:
+                pool.discard(conn)
+                if attempt == 2:
+                    raise
+                logger.warning("Database connection lost, retrying query: %s", e)
+                self.metrics.count('pool_query_retries')
+            except Exception:
+                pool.release(conn)
+                raise
+            else:
+                pool.release(conn)
+                return results
+
+    def stream(self, query, params=None, row_type=named_rows, chunk_size=STREAM_FETCH_SIZE):
+        """Yield the rows of query in lists of up to chunk_size as the server
+        sends them, without buffering the whole result.
+
+        The statement is prepared once per connection and reused by later
+        calls with the same SQL. Stopping early drains the rest of the
+        result so the connection can go back to the pool.
+        """
+        self.round_trips.record()
+        pool = self.get_pool()
+        with self.metrics.stage('pool_wait'):
+            conn = pool.acquire()
+        cursor = None
+        try:
+            cursor, statement = self.prepared_cursor(conn, query)
+            with self.metrics.stage('db'):
+                cursor.execute(statement, params or ())
+            yield from chunked(cursor, row_type, chunk_size)
+        except BaseException:
+            # Includes GeneratorExit when the caller stops iterating early
+            self._finish(pool, conn, cursor)
+            raise
+        else:
+            pool.release(conn)
+
+    def _finish(self, pool, conn, cursor):
+        """Release a connection whose stream stopped early, or discard it if
+        its unread rows cannot be drained"""
+        try:
+            if cursor is not None:
+                cursor.fetchall()
+        except Exception as e:
+            logger.warning("Discarding database connection after an interrupted stream: %s", e)
+            pool.discard(conn)
+        else:
+            pool.release(conn)
+
+    @staticmethod
+    def prepared_cursor(conn, query):
+        """(prepared cursor, statement) for query, cached on the connection.
+
+        The cursor only reuses its prepared statement when execute() is
+        given the very string object it last ran, not merely an equal one,
+        so the statement to execute is the one cached with the cursor.
+        """
+        cursors = getattr(conn, 'addmaths_prepared', None)
+        if cursors is None:
+            cursors = conn.addmaths_prepared = OrderedDict()
+        cached = cursors.get(query)
+        if cached is not None:
+            cursors.move_to_end(query)
+            return cached
+        cached = cursors[query] = (conn.cursor(prepared=True), query)
+        if len(cursors) > PREPARED_CACHE_SIZE:
+            cursors.popitem(last=False)[1][0].close()
+        return cached
+
+    def table_versions(self, tables):
+        """Cheap change markers: the time each table was last modified,
+        read from the server's table statistics without touching any rows"""
+        placeholders = ', '.join(['%s'] * len(tables))
+        rows = self.query("SELECT TABLE_NAME AS TableName, UPDATE_TIME AS UpdateTime FROM information_schema.TABLES "
+                          f"WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME IN ({placeholders})", tuple(tables))
+        versions = {row['TableName']: row['UpdateTime'] for row in rows}
+        return {table: versions.get(table) for table in tables}
+
+    def table_checksums(self, tables):
+        """Content checksums. CHECKSUM TABLE reads every row, so these are
+        only checked when a table's TTL expires, to catch edits that
+        table_versions() missed (UPDATE_TIME has one second resolution and
+        is forgotten when the server restarts)"""
+        rows = self.query(f"CHECKSUM TABLE {', '.join(tables)}")
+        return {row['Table'].split('.')[-1]: row['Checksum'] for row in rows}
+
+    def close(self):
+        with self._pool_lock:
+            if self._pool is not None:
+                self._pool.close()
+                self._pool = None
+
+
+# Load environment variables, once, before the first connection
+def load_environment(env_file):
+    try:
+        from dotenv import load_dotenv
+        load_dotenv(env_file)
+        logger.info("Environment variables loaded successfully")
+    except Exception as e:
+        logger.error("Failed to load environment variables: %s", e)
+
+
+# MySQL dump parsing
+CREATE_TABLE_PATTERN = re.compile(r"CREATE TABLE `(\w+)` \((.*?)\n\)[^;]*;", re.S)
+INSERT_PATTERN = re.compile(r"INSERT INTO `(\w+)` VALUES (.*?);\s*$", re.S | re.M)
+COLUMN_PATTERN = re.compile(r"`(\w+)` (\w+)(?:\(\d+\))?(.*)")
+KEY_PATTERN = re.compile(r"(PRIMARY|UNIQUE)? ?KEY (?:`(\w+)` )?\(([^)]*)\)")
+MYSQL_ESCAPES = {'n': '\n', 'r': '\r', 't': '\t', '0': '\0', 'Z': '\x1a', 'b': '\b'}
+SQLITE_TYPES = {'int': 'INTEGER', 'bigint': 'INTEGER', 'tinyint': 'INTEGER', 'smallint': 'INTEGER'}
+
+
+def parse_create_table(table, body):
+    """Translate a MySQL CREATE TABLE body into SQLite DDL statements"""
+    columns, primary_key, indexes = [], None, []
+    for line in body.splitlines():
+        line = line.strip().rstrip(',')
+        column = COLUMN_PATTERN.match(line)
+        if column:
+            name, mysql_type, rest = column.groups()
+            sqlite_type = SQLITE_TYPES.get(mysql_type.lower(), 'TEXT')
+            # utf8mb4_general_ci compares text case-insensitively
+            collate = ' COLLATE NOCASE' if sqlite_type == 'TEXT' else ''
+            not_null = ' NOT NULL' if 'NOT NULL' in rest else ''
+            columns.append(f'"{name}" {sqlite_type}{collate}{not_null}')
+            continue
+        key = KEY_PATTERN.match(line)
+        if key:
+            kind, index_name, key_columns = key.groups()
+            key_columns = ', '.join(f'"{c.strip(" `")}"' for c in key_columns.split(','))
+            if kind == 'PRIMARY':
+                primary_key = key_columns
+            else:
+                unique = 'UNIQUE ' if kind == 'UNIQUE' else ''
+                indexes.append(f'CREATE {unique}INDEX "{table}_{index_name}" ON "{table}" ({key_columns})')
+        # Foreign key constraints are not enforced by the embedded copy
+    if primary_key:
+        columns.append(f'PRIMARY KEY ({primary_key})')
+    return [f'CREATE TABLE "{table}" ({", ".join(columns)})'] + indexes
+
+
+def parse_values(text):
+    """Parse the VALUES list of a MySQL extended INSERT into tuples"""
+    rows, row, i, length = [], None, 0, len(text)
+    while i < length:
+        char = text[i]
+        if char == '(':
+            row = []
+            i += 1
+        elif char == ')':
+            rows.append(tuple(row))
+            i += 1
+        elif char in ', \r\n':
+            i += 1
+        elif char == "'":
+            value, i = [], i + 1
+            while text[i] != "'" or text[i + 1:i + 2] == "'":
+                if text[i] == '\\':
+                    value.append(MYSQL_ESCAPES.get(text[i + 1], text[i + 1]))
+                    i += 2
+                elif text[i] == "'":
+                    value.append("'")
+                    i += 2
+                else:
+                    value.append(text[i])
+                    i += 1
+            row.append(''.join(value))
+            i += 1
+        else:
+            end = i
+            while end < length and text[end] not in ',)':
+                end += 1
+            token = text[i:end].strip()
+            if token.upper() == 'NULL':
+                row.append(None)
+            else:
+                row.append(float(token) if '.' in token else int(token))
+            i = end
+    return rows
+
+
+def parse_dump(sql):
+    """Return {table: (ddl statements, rows, checksum)} for every table in a dump"""
+    tables = {}
+    for match in CREATE_TABLE_PATTERN.finditer(sql):
+        table = match.group(1)
+        tables[table] = [parse_create_table(table, match.group(2)), [], zlib.crc32(match.group(0).encode('utf8'))]
+    for match in INSERT_PATTERN.finditer(sql):
+        entry = tables[match.group(1)]
+        entry[1].extend(parse_values(match.group(2)))
+        entry[2] = zlib.crc32(match.group(0).encode('utf8'), entry[2])
+    return {table: tuple(entry) for table, entry in tables.items()}
+
+
+# MySQL functions used by the engine's digest queries
+class BitXor:
+    def __init__(self):
+        self.value = 0
+
+    def step(self, value):
+        if value is not None:
+            self.value ^= int(value)
+
+    def finalize(self):
+        return self.value
+
+
+def concat_ws(separator, *values):
+    return separator.join(str(value) for value in values if value is not None)
+
+
+def crc32(value):
+    return None if value is None else zlib.crc32(str(value).encode('utf8'))
+
+
+def dict_factory(cursor, row):
+    return {column[0]: value for column, value in zip(cursor.description, row)}
+
+
+class SQLiteBackend:
+    """Embedded copy of the database, ingested from the MySQL dump.
+
+    Each thread gets its own connection. The dump's modification time and
+    size are recorded at ingest; when they change, table_versions() (polled
+    by the knowledge base) re-ingests the dump in one transaction, and the
+    per-table checksums recorded from the dump tell the knowledge base which
+    tables changed.
+    """
+
+    name = 'sqlite'
+    Error = sqlite3.Error
+
+    def __init__(self, path=SQLITE_FILE, dump_path=DUMP_FILE):
+        self.path = path
+        self.dump_path = dump_path
+        self._local = threading.local()
+        self._connections = []
+        self._ingest_lock = threading.Lock()
+        self._checked = False
+        self.round_trips = RoundTripCounter()
+        self.metrics = Metrics(enabled=False)
+
+    def connect(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, isolation_level=None, check_same_thread=False, uri=True)
+            conn.row_factory = dict_factory
+            conn.create_function('CRC32', 1, crc32, deterministic=True)
+            conn.create_function('CONCAT_WS', -1, concat_ws, deterministic=True)
+            conn.create_aggregate('BIT_XOR', 1, BitXor)
+            conn.execute('PRAGMA journal_mode=WAL')
+            self._local.conn = conn
+            self._connections.append(conn)
+        if not self._checked:
+            self.ingest_if_stale()
+        return conn
+
+    def dump_signature(self):
+        stat = os.stat(self.dump_path)
+        return f"{stat.st_mtime_ns}:{stat.st_size}"
+
+    def ingest_if_stale(self):
+        """Build the embedded database from the dump if missing or out of date"""
+        with self._ingest_lock:
+            self._checked = True
+            conn = self._local.conn
+            signature = self.dump_signature()
+            try:
+                row = conn.execute("SELECT value FROM _ingest WHERE key = 'dump'").fetchone()
+            except sqlite3.OperationalError:
+                row = None
+            if row and row['value'] == signature:
+                return False
+            self.ingest(conn, signature)
+            return True
+
+    def ingest(self, conn, signature):
+        with open(self.dump_path, encoding='utf8') as dump:
+            tables = parse_dump(dump.read())
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            conn.execute('CREATE TABLE IF NOT EXISTS _ingest (key TEXT PRIMARY KEY, value TEXT)')
+            for table, (statements, rows, checksum) in tables.items():
+                conn.execute(f'DROP TABLE IF EXISTS "{table}"')
+                for statement in statements:
+                    conn.execute(statement)
+                if rows:
+                    placeholders = ', '.join('?' * len(rows[0]))
+                    conn.executemany(f'INSERT INTO "{table}" VALUES ({placeholders})', rows)
+                conn.execute("INSERT OR REPLACE INTO _ingest VALUES (?, ?)", (f'table:{table}', str(checksum)))
+            conn.execute("INSERT OR REPLACE INTO _ingest VALUES ('dump', ?)", (signature,))
+            conn.execute('COMMIT')
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+        logger.info("Embedded database built from %s: %s", self.dump_path,
+                    ", ".join(f"{table} ({len(rows)} rows)" for table, (_, rows, _) in tables.items()))
+
+    def query(self, query, params=None):
+        self.round_trips.record()
+        conn = self.connect()
+        with self.metrics.stage('db'):
+            return conn.execute(query.replace('%s', '?'), params or ()).fetchall()
+
+    def stream(self, query, params=None, row_type=named_rows, chunk_size=STREAM_FETCH_SIZE):
+        """Yield the rows of query in lists of up to chunk_size; sqlite3
+        reuses its compiled statements from its own statement cache"""
+        self.round_trips.record()
+        cursor = self.connect().cursor()
+        cursor.row_factory = None
+        try:
+            with self.metrics.stage('db'):
+                cursor.execute(query.replace('%s', '?'), params or ())
+            yield from chunked(cursor, row_type, chunk_size)
+        finally:
+            cursor.close()
+
+    def table_versions(self, tables):
+        self.connect()
+        # Pick up a replaced dump before reporting checksums
+        self.ingest_if_stale()
+        rows = self.query("SELECT key, value FROM _ingest WHERE key LIKE 'table:%'")
+        checksums = {row['key'][len('table:'):]: row['value'] for row in rows}
+        return {table: checksums.get(table) for table in tables}
+
+    def table_checksums(self, tables):
+        # Recorded at ingest, so already as cheap as table_versions()
+        return self.table_versions(tables)
+
+    def close(self):
+        for conn in self._connections:
+            conn.close()
+        self._connections = []
+        self._local = threading.local()
+
+
+def create_backend(kind=None, db_config=None, pool_size=5, env_file=None):
+    """Backend named by kind, or by ADDMATHS_BACKEND (default "mysql")"""
+    kind = (kind or os.environ.get('ADDMATHS_BACKEND', 'mysql')).lower()
+    if kind == 'sqlite':
+        return SQLiteBackend(os.environ.get('ADDMATHS_SQLITE_FILE', SQLITE_FILE))
+    if kind == 'mysql':
+        return MySQLBackend(db_config, pool_size, env_file)
+    raise ValueError(f"Unknown storage backend '{kind}'")
+
+
+if __name__ == "__main__":
+    import sys
+    logging.basicConfig(level=logging.INFO, format='%(message)s')
+    dump_path = sys.argv[1] if len(sys.argv) > 1 else DUMP_FILE
+    path = sys.argv[2] if len(sys.argv) > 2 else SQLITE_FILE
+    backend = SQLiteBackend(path, dump_path)
+    backend.connect()
+    for table, checksum in backend.table_checksums(['topic', 'questions', 'subquestions', 'steps', 'formulas']).items():
+        count = backend.query(f'SELECT COUNT(*) AS n FROM "{table}"')[0]['n']
+        print(f"{table}: {count} rows (checksum {checksum})")
+    backend.close()
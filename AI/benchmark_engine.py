@@ -0,0 +1,205 @@
+"""Benchmark the engine's hot paths on a synthetic question bank.
+
+Usage: python benchmark_engine.py [--topics 500] [--questions 20000] [--steps 60000]
+                                  [--queries 300] [--seed 1] [--output results.json]
+
+A bank of Malay-style topics, questions, subquestions and steps (10 to
+10,000 topics, up to 1M questions or steps) is generated into an in-memory
+SQLite database and served through the normal storage backend interface.
+The intent router, topic matcher, full-text search and every handler are then timed, and the
+results are written as JSON so runs can be compared across versions.
+"""
+import argparse
+import json
+import platform
+import random
+import subprocess
+import sys
+import time
+from addmaths_engine import AddMathsEngine, CONTENT_TABLES, determine_intent, normalize_input
+from addmaths_storage import DUMP_FILE, SQLiteBackend, parse_dump
+from benchmark_topic_index import WORDS, synthetic_topics, synthetic_queries
+
+VERBS = ['Cari', 'Diberi', 'Hitungkan', 'Tentukan', 'Selesaikan', 'Buktikan', 'Lakarkan', 'Ungkapkan']
+TERMS = ['nilai x', 'punca-punca persamaan', 'julat nilai k', 'koordinat titik', 'kecerunan tangen',
+         'luas rantau berlorek', 'sebutan ke-n', 'hasil tambah', 'fungsi songsang', 'nilai minimum']
+ROMAN = ['i', 'ii', 'iii', 'iv', 'v', 'vi']
+
+
+class SyntheticBackend(SQLiteBackend):
+    """SQLite backend over a shared in-memory database holding a synthetic bank"""
+
+    def __init__(self, rows_by_table):
+        super().__init__(f"file:addmaths_bench_{id(self)}?mode=memory&cache=shared")
+        self._checked = True
+        # The first connection keeps the in-memory database alive
+        conn = self.connect()
+        with open(DUMP_FILE, encoding='utf8') as dump:
+            tables = parse_dump(dump.read())
+        for table, rows in rows_by_table.items():
+            for statement in tables[table][0]:
+                conn.execute(statement)
+            columns = ', '.join(f'"{column}"' for column in rows[0]) if rows else ''
+            placeholders = ', '.join('?' * len(rows[0])) if rows else ''
+            conn.executemany(f'INSERT INTO "{table}" ({columns}) VALUES ({placeholders})',
+                             [tuple(row.values()) for row in rows])
+
+    def table_versions(self, tables):
+        # The synthetic bank never changes
+        return {table: 0 for table in tables}
+
+
+def sentence(rng, words=6):
+    return f"{rng.choice(VERBS)} {rng.choice(TERMS)} " + " ".join(rng.sample(WORDS, words))
+
+
+def synthetic_bank(topic_count, question_count, step_count, rng):
+    """Rows for every content table. Questions are numbered across the bank,
+    some with a part letter ('12a'); about half have roman-numbered
+    subquestions ('12ai'), and steps go to subquestions where there are any"""
+    topics = synthetic_topics(topic_count, rng)
+    rows = {table: [] for table in CONTENT_TABLES}
+    rows['topic'] = [{'TopicID': topic_id, 'TopicName': name.title()} for topic_id, name in topics.items()]
+    for formula_id, topic_id in enumerate(topics, 1):
+        rows['formulas'].append({'FormulaID': formula_id, 'FormulaContent': f"y = {rng.randint(2, 9)}x^2 + c",
+                                 'TopicID': topic_id})
+
+    parents = []
+    number = 0
+    while len(rows['questions']) < question_count:
+        number += 1
+        topic_id = rng.randint(1, topic_count)
+        for letter in (['a', 'b'] if rng.random() < 0.3 else ['']):
+            question_id = f"{number}{letter}"
+            rows['questions'].append({'QuestionID': question_id, 'Description': sentence(rng),
+                                      'TopicID': topic_id})
+            parts = rng.randint(2, 4) if rng.random() < 0.5 else 0
+            subquestion_ids = [f"{question_id}{numeral}" for numeral in ROMAN[:parts]]
+            for subquestion_id in subquestion_ids:
+                rows['subquestions'].append({'SubquestionID': subquestion_id, 'Description': sentence(rng, 3),
+                                             'QuestionID': question_id})
+            parents.append((question_id, subquestion_ids))
+    del rows['questions'][question_count:]
+    parents = parents[:question_count]
+
+    for step_id in range(1, step_count + 1):
+        question_id, subquestion_ids = rng.choice(parents)
+        rows['steps'].append({'StepID': step_id, 'Description': f"{step_id}. {sentence(rng, 2)}",
+                              'SubquestionID': rng.choice(subquestion_ids) if subquestion_ids else None,
+                              'QuestionID': question_id})
+    return topics, rows
+
+
+def measure(func, inputs):
+    """Time func on every input; summary statistics in microseconds"""
+    timings = []
+    for item in inputs:
+        start = time.perf_counter()
+        func(item)
+        timings.append((time.perf_counter() - start) * 1e6)
+    timings.sort()
+    return {
+        'calls': len(timings),
+        'total_ms': round(sum(timings) / 1000, 3),
+        'mean_us': round(sum(timings) / len(timings), 2),
+        'p50_us': round(timings[len(timings) // 2], 2),
+        'p95_us': round(timings[min(len(timings) - 1, int(len(timings) * 0.95))], 2),
+        'max_us': round(timings[-1], 2),
+    }
+
+
+def git_revision():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run(args):
+    rng = random.Random(args.seed)
+    start = time.perf_counter()
+    topics, rows = synthetic_bank(args.topics, args.questions, args.steps, rng)
+    generate_time = time.perf_counter() - start
+
+    engine = AddMathsEngine(backend=SyntheticBackend(rows))
+    start = time.perf_counter()
+    engine.ensure_loaded()
+    load_time = time.perf_counter() - start
+    engine.knowledge_base.stop_auto_refresh()
+
+    topic_queries = [normalize_input(query) for query in synthetic_queries(topics, args.queries, rng)]
+    question_ids = [row['QuestionID'] for row in rng.choices(rows['questions'], k=args.queries)]
+    subquestion_ids = [row['SubquestionID'] for row in rng.choices(rows['subquestions'], k=args.queries)]
+    mixed = [rng.choice([f"show steps for question {rng.choice(question_ids)}", "list topics",
+                         "list all questions", f"list questions for {query}", query, "help"])
+             for query in topic_queries]
+    topic_names = [name for _, name in rng.choices(list(topics.items()), k=args.queries)]
+    listing_calls = max(1, args.queries // 10)
+
+    def cold(func):
+        # Render from the knowledge base rather than the response cache
+        def call(item):
+            engine.rendered_cache.clear()
+            return func(item)
+        return call
+
+    results = {
+        'determine_intent': measure(determine_intent, mixed),
+        'fuzzy_match_topic': measure(engine.fuzzy_match_topic, topic_queries),
+        'search': measure(engine.search, [" ".join(row['Description'].split()[:5])
+                                          for row in rng.choices(rows['steps'] or rows['questions'], k=args.queries)]),
+        'handle_show_topic_info': measure(cold(engine.handle_show_topic_info), topic_queries),
+        'handle_show_topic_info_cached': measure(engine.handle_show_topic_info, topic_names),
+        'handle_show_steps': measure(engine.handle_show_steps, [f"steps for {qid}" for qid in question_ids]),
+        'handle_show_steps_subquestion': measure(engine.handle_show_steps,
+                                                 [f"steps for {sid}" for sid in subquestion_ids]),
+        'handle_list_topics': measure(cold(lambda _: engine.handle_list_topics()), range(listing_calls)),
+        'handle_list_questions_for_topic': measure(cold(engine.handle_list_questions_for_topic), topic_names),
+        'handle_list_all_questions': measure(cold(lambda _: engine.handle_list_all_questions()),
+                                             range(listing_calls)),
+        'handle_list_all_questions_cached': measure(lambda _: engine.handle_list_all_questions(),
+                                                    range(listing_calls)),
+        'handle_list_all_questions_page': measure(
+            lambda page: engine.handle_list_all_questions(page),
+            [rng.randint(1, 1 + len(rows['questions']) // 50) for _ in range(listing_calls)]),
+        'answer_query': measure(engine.answer_query, mixed),
+    }
+    engine.close()
+
+    return {
+        'revision': git_revision(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'parameters': vars(args),
+        'bank': {table: len(table_rows) for table, table_rows in rows.items()},
+        'generate_s': round(generate_time, 3),
+        'load_s': round(load_time, 3),
+        'results': results,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--topics', type=int, default=500, help="10 to 10,000")
+    parser.add_argument('--questions', type=int, default=20000, help="up to 1,000,000")
+    parser.add_argument('--steps', type=int, default=60000, help="up to 1,000,000")
+    parser.add_argument('--queries', type=int, default=300)
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--output', help="write the JSON results here instead of stdout")
+    args = parser.parse_args()
+    if not 10 <= args.topics <= 10000:
+        parser.error("--topics must be between 10 and 10,000")
+    if not 1 <= args.questions <= 1000000 or not 0 <= args.steps <= 1000000:
+        parser.error("--questions and --steps must be at most 1,000,000")
+
+    report = json.dumps(run(args), indent=2)
+    if args.output:
+        with open(args.output, 'w', encoding='utf8') as output:
+            output.write(report + "\n")
+    else:
+        print(report)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
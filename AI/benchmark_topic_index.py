@@ -0,0 +1,111 @@
+"""Compare the trigram topic index with the original linear fuzzy scan.
+
+Usage: python benchmark_topic_index.py [--topics 500] [--queries 300] [--seed 1]
+
+Every query is answered both ways; the script fails loudly if any answer
+differs, then prints the per-query timings.
+"""
+import argparse
+import random
+import time
+from fuzzywuzzy import fuzz
+from topic_index import TopicIndex
+
+FUZZY_MATCH_THRESHOLD = 50
+
+WORDS = [
+    'fungsi', 'kuadratik', 'sistem', 'persamaan', 'indeks', 'surd', 'logaritma', 'janjang',
+    'hukum', 'linear', 'geometri', 'koordinat', 'vektor', 'penyelesaian', 'segi', 'tiga',
+    'nombor', 'sukatan', 'membulat', 'pembezaan', 'pengamiran', 'permutasi', 'kombinasi',
+    'taburan', 'kebarangkalian', 'fungsi', 'trigonometri', 'pengaturcaraan', 'kinematik',
+    'gerakan', 'aritmetik', 'geometri', 'songsang', 'gubahan', 'ketaksamaan', 'graf',
+]
+FILLER = ['apa', 'itu', 'tolong', 'terangkan', 'what', 'is', 'the', 'formula', 'for', 'about', 'please']
+
+
+def synthetic_topics(count, rng):
+    topics = {}
+    while len(topics) < count:
+        name = " ".join(rng.sample(WORDS, rng.randint(1, 4)))
+        if len(topics) % 3 == 0:
+            name += f" {rng.randint(1, 5)}"
+        topics[len(topics) + 1] = name
+    return topics
+
+
+def typo(word, rng):
+    if len(word) < 3:
+        return word
+    i = rng.randrange(len(word))
+    return word[:i] + rng.choice('aeiouxyz') + word[i + 1:]
+
+
+def synthetic_queries(topics, count, rng):
+    names = list(topics.values())
+    queries = []
+    for _ in range(count):
+        name = rng.choice(names)
+        kind = rng.randrange(4)
+        if kind == 0:
+            queries.append(name)
+        elif kind == 1:
+            queries.append(" ".join(typo(word, rng) for word in name.split()))
+        elif kind == 2:
+            queries.append(" ".join(rng.sample(FILLER, 3) + name.split()[:2]))
+        else:
+            queries.append(" ".join(rng.sample(FILLER, 2)))
+    return queries
+
+
+def linear_match(user_query, topics_dict):
+    """The original fuzzy_match_topic: score every topic"""
+    best_match = None
+    best_topic_id = None
+    highest_score = 0
+    for topic_id, topic_name in topics_dict.items():
+        score = fuzz.token_sort_ratio(user_query, topic_name)
+        if score > highest_score and score > FUZZY_MATCH_THRESHOLD:
+            highest_score = score
+            best_match = topic_name
+            best_topic_id = topic_id
+    return (best_match, highest_score, best_topic_id) if best_match else None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--topics', type=int, default=500)
+    parser.add_argument('--queries', type=int, default=300)
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    topics = synthetic_topics(args.topics, rng)
+    queries = synthetic_queries(topics, args.queries, rng)
+
+    start = time.perf_counter()
+    index = TopicIndex(topics, FUZZY_MATCH_THRESHOLD)
+    build_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    expected = [linear_match(query, topics) for query in queries]
+    linear_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    actual = [index.best_match(query) for query in queries]
+    index_time = time.perf_counter() - start
+
+    mismatches = [(q, e, a) for q, e, a in zip(queries, expected, actual) if e != a]
+    for query, want, got in mismatches[:10]:
+        print(f"MISMATCH {query!r}: linear={want} index={got}")
+    if mismatches:
+        raise SystemExit(f"{len(mismatches)} of {len(queries)} answers differ")
+
+    print(f"{len(topics)} topics, {len(queries)} queries, identical results")
+    print(f"index build:  {build_time * 1000:8.1f} ms")
+    print(f"linear scan:  {linear_time / len(queries) * 1000:8.3f} ms/query")
+    print(f"trigram index:{index_time / len(queries) * 1000:8.3f} ms/query "
+          f"({linear_time / index_time:.1f}x faster)")
+
+
+if __name__ == "__main__":
+    main()
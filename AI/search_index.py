@@ -0,0 +1,164 @@
+import heapq
+import math
+import re
+from collections import Counter
+
+# Tables whose Description is searchable: table -> (primary key, question column, subquestion column)
+SEARCHABLE_TABLES = {
+    'questions': ('QuestionID', 'QuestionID', None),
+    'subquestions': ('SubquestionID', 'QuestionID', 'SubquestionID'),
+    'steps': ('StepID', 'QuestionID', 'SubquestionID'),
+}
+
+# Words and numbers, plus single symbols so that 'f:x → 5 - 3x' keeps its
+# arrow and operators
+TOKEN_PATTERN = re.compile(r'[^\W_]+|[^\w\s]')
+
+
+def tokenize(text):
+    return TOKEN_PATTERN.findall(text.lower())
+
+
+class SearchIndex:
+    """Inverted index with BM25 ranking over question, subquestion and step text.
+
+    Every row is a document; a hit is reported against the question (and
+    subquestion, if any) it belongs to, keeping the best scoring document of
+    each. add()/remove() keep the index current as rows change, so it never
+    needs a full rebuild after the initial load.
+    """
+
+    k1 = 1.2
+    b = 0.75
+    # Terms in more than this share of documents are skipped when the query
+    # has rarer terms; they add little to the ranking and a lot of postings
+    common_fraction = 0.5
+
+    def __init__(self):
+        self.postings = {}    # term -> {document key: term frequency}
+        self.documents = {}   # document key -> (question ID, subquestion ID, length, terms)
+        self.total_length = 0
+
+    def __len__(self):
+        return len(self.documents)
+
+    @classmethod
+    def from_snapshot(cls, snapshot):
+        index = cls()
+        for table in SEARCHABLE_TABLES:
+            for rows in snapshot.partitions[table].values():
+                index.add_rows(table, rows)
+        return index
+
+    def add(self, key, text, question_id, subquestion_id=None):
+        if key in self.documents:
+            self.remove(key)
+        counts = Counter(tokenize(text or ''))
+        length = sum(counts.values())
+        self.documents[key] = (question_id, subquestion_id, length, tuple(counts))
+        self.total_length += length
+        for term, count in counts.items():
+            self.postings.setdefault(term, {})[key] = count
+
+    def remove(self, key):
+        document = self.documents.pop(key, None)
+        if document is None:
+            return
+        self.total_length -= document[2]
+        for term in document[3]:
+            postings = self.postings[term]
+            del postings[key]
+            if not postings:
+                del self.postings[term]
+
+    def add_rows(self, table, rows):
+        primary_key, question_column, subquestion_column = SEARCHABLE_TABLES[table]
+        for row in rows:
+            self.add((table, row[primary_key]), row['Description'], row[question_column],
+                     row[subquestion_column] if subquestion_column else None)
+
+    def remove_rows(self, table, rows):
+        primary_key = SEARCHABLE_TABLES[table][0]
+        for row in rows:
+            self.remove((table, row[primary_key]))
+
+    def update(self, old_snapshot, new_snapshot, changed_tables):
+        """Reindex the partitions that differ between two snapshots. Snapshots
+        share unchanged partitions, so only replaced ones are compared."""
+        for table in changed_tables:
+            if table not in SEARCHABLE_TABLES:
+                continue
+            old_partitions = old_snapshot.partitions[table]
+            new_partitions = new_snapshot.partitions[table]
+            for key in set(old_partitions) | set(new_partitions):
+                old_rows = old_partitions.get(key, ())
+                new_rows = new_partitions.get(key, ())
+                if old_rows is not new_rows:
+                    self.remove_rows(table, old_rows)
+                    self.add_rows(table, new_rows)
+
+    def search(self, text, limit=5):
+        """Best (score, question ID, subquestion ID) matches, highest first.
+
+        Terms are scored rarest first. Once the documents already scored
+        include enough targets that even a document matching every remaining
+        term could not overtake them, the remaining (common, long) posting
+        lists are only probed for those documents instead of walked in full.
+        """
+        document_count = len(self.documents)
+        if not document_count:
+            return []
+        terms = [term for term in set(tokenize(text)) if term in self.postings]
+        rare = [term for term in terms if len(self.postings[term]) <= document_count * self.common_fraction]
+        if rare:
+            terms = rare
+
+        weighted = sorted(((math.log(1 + (document_count - len(self.postings[term]) + 0.5)
+                                     / (len(self.postings[term]) + 0.5)), term) for term in terms), reverse=True)
+        # Highest score the terms from position i onwards can still add
+        remaining = [0.0] * (len(weighted) + 1)
+        for i in range(len(weighted) - 1, -1, -1):
+            remaining[i] = remaining[i + 1] + weighted[i][0] * (self.k1 + 1)
+
+        documents = self.documents
+        k1 = self.k1
+        base = k1 * (1 - self.b)
+        per_length = k1 * self.b * document_count / self.total_length if self.total_length else 0.0
+        scores = {}
+        for i, (idf, term) in enumerate(weighted):
+            postings = self.postings[term]
+            # The best score so far bounds the threshold; only then is it worth computing
+            threshold = (self._threshold(scores, limit)
+                         if len(scores) >= limit and remaining[i] <= max(scores.values()) else None)
+            if threshold is not None and remaining[i] <= threshold:
+                scores = {key: score for key, score in scores.items() if score + remaining[i] >= threshold}
+                for key in scores:
+                    count = postings.get(key)
+                    if count:
+                        scores[key] += idf * count * (k1 + 1) / (count + base + per_length * documents[key][2])
+            else:
+                for key, count in postings.items():
+                    weight = idf * count * (k1 + 1) / (count + base + per_length * documents[key][2])
+                    scores[key] = scores.get(key, 0.0) + weight
+
+        top = heapq.nlargest(limit, self._best_by_target(scores).items(), key=lambda item: item[1])
+        return [(score, question_id, subquestion_id) for (question_id, subquestion_id), score in top]
+
+    def _best_by_target(self, scores):
+        best = {}
+        for key, score in scores.items():
+            target = self.documents[key][:2]
+            if score > best.get(target, 0.0):
+                best[target] = score
+        return best
+
+    def _threshold(self, scores, limit):
+        """Score of the limit-th best target so far, or None if there are fewer"""
+        # Usually the best few documents already belong to enough targets
+        for count in (limit * 4, len(scores)):
+            targets = {}
+            for key in heapq.nlargest(count, scores, key=scores.get):
+                targets.setdefault(self.documents[key][:2], scores[key])
+                if len(targets) == limit:
+                    return scores[key]
+        return None
@@ -0,0 +1,182 @@
+"""Optional semantic matching of queries to topics and questions.
+
+Topics and questions are embedded offline by a small sentence-embedding
+model on the CPU:
+
+    python semantic_index.py [--output PATH] [--model NAME]
+
+The vectors are saved as a NumPy matrix (PATH.npy) beside a JSON list of
+the rows they belong to (PATH.json). At run time the matrix is memory-
+mapped, so it costs next to nothing to open and its pages are shared by
+every process using it, and a query is embedded once and scored against
+every row in a single matrix-vector product.
+
+Only the engine's semantic mode (ADDMATHS_SEMANTIC=1) imports this module;
+transformers and torch are imported when the model is first needed. Its
+dependencies are not part of requirement.txt; install them with
+
+    pip install -r requirement-semantic.txt
+"""
+import argparse
+import json
+import os
+import zlib
+import logging
+import numpy as np
+
+logger = logging.getLogger('addmaths_ai')
+
+# Small multilingual model; the question bank mixes Malay and English
+SEMANTIC_MODEL = os.environ.get("ADDMATHS_SEMANTIC_MODEL",
+                                "sentence-transformers/paraphrase-multilingual-MiniLM-L12-v2")
+SEMANTIC_INDEX_PATH = os.environ.get(
+    "ADDMATHS_SEMANTIC_INDEX",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'Database', 'semantic_index'))
+EMBED_BATCH_SIZE = 32
+
+# Row kinds, in the order their codes are stored in the index
+KINDS = ('topic', 'question')
+
+
+def text_checksum(text):
+    return zlib.crc32((text or '').encode('utf8'))
+
+
+def semantic_rows(snapshot):
+    """(kind, ID, text) of every topic and question in a knowledge snapshot"""
+    for topic in snapshot.get_all_topics():
+        yield 'topic', topic['TopicID'], topic['TopicName']
+    for question in snapshot.get_all_questions():
+        yield 'question', question['QuestionID'], question['Description']
+
+
+class Embedder:
+    """Mean-pooled, unit-length sentence embeddings from a transformers model"""
+
+    def __init__(self, model_name=SEMANTIC_MODEL, batch_size=EMBED_BATCH_SIZE):
+        self.model_name = model_name
+        self.batch_size = batch_size
+        self.tokenizer = None
+        self.model = None
+
+    def load(self):
+        if self.model is not None:
+            return
+        # Deferred so that the default mode never pays for importing them
+        from transformers import AutoModel, AutoTokenizer
+        logger.info("Loading embedding model %s", self.model_name)
+        self.tokenizer = AutoTokenizer.from_pretrained(self.model_name)
+        self.model = AutoModel.from_pretrained(self.model_name)
+        self.model.eval()
+
+    def encode(self, texts):
+        """float32 matrix with one unit-length row per text"""
+        import torch
+        self.load()
+        batches = []
+        with torch.inference_mode():
+            for start in range(0, len(texts), self.batch_size):
+                encoded = self.tokenizer(list(texts[start:start + self.batch_size]), padding=True,
+                                         truncation=True, return_tensors='pt')
+                hidden = self.model(**encoded).last_hidden_state
+                mask = encoded['attention_mask'].unsqueeze(-1).to(hidden.dtype)
+                pooled = (hidden * mask).sum(dim=1) / mask.sum(dim=1).clamp(min=1e-9)
+                batches.append(torch.nn.functional.normalize(pooled, dim=1).numpy())
+        if not batches:
+            return np.zeros((0, 0), dtype=np.float32)
+        return np.concatenate(batches).astype(np.float32, copy=False)
+
+
+def build(snapshot, path=SEMANTIC_INDEX_PATH, embedder=None):
+    """Embed every topic and question of snapshot and write the index files"""
+    embedder = embedder or Embedder()
+    rows = list(semantic_rows(snapshot))
+    vectors = embedder.encode([text for _, _, text in rows])
+    metadata = {'model': embedder.model_name, 'dimension': int(vectors.shape[1]) if rows else 0,
+                'rows': [[kind, row_id, text_checksum(text)] for kind, row_id, text in rows]}
+
+    # np.save appends .npy to names without it, so write through open files
+    for suffix, write in (('.npy', lambda output: np.save(output, vectors)),
+                          ('.json', lambda output: output.write(json.dumps(metadata).encode('utf8')))):
+        temporary = f"{path}{suffix}.tmp"
+        with open(temporary, 'wb') as output:
+            write(output)
+        os.replace(temporary, f"{path}{suffix}")
+    logger.info("Embedded %d topics and questions into %s.npy", len(rows), path)
+    return len(rows)
+
+
+class SemanticIndex:
+    """Memory-mapped embeddings of topics and questions.
+
+    Rows whose text changed or disappeared since the index was built are
+    masked out by sync(); rows added since then are simply not found until
+    the index is rebuilt.
+    """
+
+    def __init__(self, vectors, rows, embedder):
+        self.vectors = vectors
+        self.rows = rows          # (kind, ID, text checksum) per matrix row
+        self.embedder = embedder
+        self.kinds = np.array([KINDS.index(kind) for kind, _, _ in rows], dtype=np.int8)
+        self.valid = np.ones(len(rows), dtype=bool)
+
+    def __len__(self):
+        return int(self.valid.sum())
+
+    @classmethod
+    def load(cls, path=SEMANTIC_INDEX_PATH, embedder=None):
+        with open(f"{path}.json", encoding='utf8') as source:
+            metadata = json.load(source)
+        vectors = np.load(f"{path}.npy", mmap_mode='r')
+        rows = [tuple(row) for row in metadata['rows']]
+        if vectors.shape[0] != len(rows):
+            raise ValueError(f"{path}.npy has {vectors.shape[0]} rows, {path}.json lists {len(rows)}")
+        return cls(vectors, rows, embedder or Embedder(metadata['model']))
+
+    def sync(self, snapshot):
+        """Mask out rows that no longer match the knowledge base"""
+        current = {(kind, row_id): text_checksum(text) for kind, row_id, text in semantic_rows(snapshot)}
+        self.valid = np.fromiter((current.get((kind, row_id)) == checksum for kind, row_id, checksum in self.rows),
+                                 dtype=bool, count=len(self.rows))
+        stale = len(self.rows) - int(self.valid.sum())
+        missing = len(current) - int(self.valid.sum())
+        if stale or missing:
+            logger.warning("Semantic index is out of date: %d stale and %d unindexed rows; "
+                           "rerun semantic_index.py to rebuild it", stale, missing)
+
+    def search(self, text, limit=5, kind=None):
+        """Best (similarity, kind, ID) matches for text, highest first"""
+        if not self.rows:
+            return []
+        query = self.embedder.encode([text])[0]
+        scores = self.vectors @ query
+        allowed = self.valid if kind is None else self.valid & (self.kinds == KINDS.index(kind))
+        scores = np.where(allowed, scores, -np.inf)
+        limit = min(limit, int(allowed.sum()))
+        if limit <= 0:
+            return []
+        top = np.argpartition(-scores, limit - 1)[:limit]
+        top = top[np.argsort(-scores[top], kind='stable')]
+        return [(float(scores[i]), self.rows[i][0], self.rows[i][1]) for i in top]
+
+
+def main():
+    from addmaths_engine import AddMathsEngine, configure_logging
+    parser = argparse.ArgumentParser(description="Embed topics and questions for semantic matching")
+    parser.add_argument('--output', default=SEMANTIC_INDEX_PATH,
+                        help="index path without extension (default: %(default)s)")
+    parser.add_argument('--model', default=SEMANTIC_MODEL)
+    args = parser.parse_args()
+
+    configure_logging()
+    engine = AddMathsEngine(semantic=False)
+    try:
+        count = build(engine.knowledge_base.load(), args.output, Embedder(args.model))
+    finally:
+        engine.close()
+    print(f"Embedded {count} topics and questions into {args.output}.npy")
+
+
+if __name__ == "__main__":
+    main()
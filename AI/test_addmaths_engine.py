@@ -0,0 +1,110 @@
+"""Tests for the engine, run against an embedded copy of the database dump.
+
+    python -m unittest test_addmaths_engine
+"""
+import os
+import shutil
+import tempfile
+import unittest
+from addmaths_engine import AddMathsEngine, Session, determine_intent, normalize_input
+from addmaths_storage import SQLiteBackend
+
+
+class EngineTestCase(unittest.TestCase):
+    """One engine over the dump for the whole class; a fresh session per test"""
+
+    @classmethod
+    def setUpClass(cls):
+        cls.directory = tempfile.mkdtemp()
+        cls.engine = AddMathsEngine(backend=SQLiteBackend(os.path.join(cls.directory, 'addmaths.sqlite3')),
+                                    stats_file=None, semantic=False)
+        if not cls.engine.ensure_loaded():
+            raise unittest.SkipTest("Unable to load the knowledge base")
+        cls.engine.knowledge_base.stop_auto_refresh()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.engine.close()
+        shutil.rmtree(cls.directory, ignore_errors=True)
+
+    def setUp(self):
+        self.session = Session()
+
+    def ask(self, query):
+        return "".join(self.engine.stream_query(query, self.session))
+
+
+class FollowUpRoutingTest(unittest.TestCase):
+
+    def intent(self, query):
+        return determine_intent(normalize_input(query))
+
+    def test_ordinal_after_for_is_a_follow_up(self):
+        self.assertEqual(self.intent("steps for the second one"), ('follow_up', 'ordinal', 2))
+        self.assertEqual(self.intent("solution for the last one"), ('follow_up', 'ordinal', -1))
+
+    def test_reference_followed_by_a_topic_is_not_a_follow_up(self):
+        self.assertEqual(self.intent("the last question on janjang"), 'show_topic_info')
+        self.assertEqual(self.intent("list the first question for fungsi"), 'show_topic_info')
+
+
+class FollowUpTest(EngineTestCase):
+
+    def test_steps_for_an_ordinal_of_the_listed_questions(self):
+        listing = self.ask("list questions for fungsi")
+        second = self.session.shown_questions[1]['QuestionID']
+        self.assertIn(second, listing)
+        self.assertTrue(self.ask("steps for the second one").lstrip().startswith(f"Question {second}:"))
+
+    def test_next_question_after_a_new_list_starts_at_its_top(self):
+        self.ask("steps for 1")
+        self.ask("list questions for janjang")
+        first = self.session.shown_questions[0]['QuestionID']
+        self.assertTrue(self.ask("next question").lstrip().startswith(f"Question {first}:"))
+
+    def test_the_last_question_on_a_topic_shows_the_topic(self):
+        self.assertIn("Topic: Janjang", self.ask("the last question on janjang"))
+
+
+
+class ListAllQuestionsTest(EngineTestCase):
+
+    def test_streamed_listing_is_rendered_once_per_version(self):
+        counters = self.engine.metrics.counters
+        self.engine.rendered_cache.clear()
+        # As when the listing is too large for the answer cache
+        self.engine.answer_cache.clear()
+        first = self.ask("all questions")
+        self.engine.answer_cache.clear()
+        hits = counters.get('response_cache_hits', 0)
+        self.assertEqual(self.ask("all questions"), first)
+        self.assertEqual(counters.get('response_cache_hits', 0), hits + 1)
+        self.assertEqual(self.engine.handle_list_all_questions(session=self.session), first)
+        self.assertEqual(len(self.session.shown_questions),
+                         len(self.engine.knowledge_base.snapshot.get_all_questions()))
+
+
+class RefreshTest(EngineTestCase):
+
+    def test_expired_tables_without_changes_keep_the_snapshot(self):
+        knowledge_base = self.engine.knowledge_base
+        snapshot = knowledge_base.snapshot
+        ttl, knowledge_base.ttl = knowledge_base.ttl, 0
+        try:
+            self.assertIs(knowledge_base.refresh(), snapshot)
+        finally:
+            knowledge_base.ttl = ttl
+
+
+class MetricsTest(EngineTestCase):
+
+    def test_streamed_query_records_total_latency(self):
+        before = self.engine.metrics.snapshot()['stages'].get('total', {}).get('count', 0)
+        self.ask("list topics")
+        stats = self.engine.metrics.snapshot()
+        self.assertEqual(stats['stages']['total']['count'], before + 1)
+        self.assertIn('total', stats['last_request']['stages_ms'])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,52 @@
+"""Tests for the storage backends' connection pool.
+
+    python -m unittest test_addmaths_storage
+"""
+import time
+import unittest
+from addmaths_storage import ConnectionPool
+
+
+class FakeConnection:
+
+    def __init__(self):
+        self.closed = False
+
+    def close(self):
+        self.closed = True
+
+
+class ConnectionPoolTest(unittest.TestCase):
+
+    def make_pool(self, **options):
+        self.connections = []
+
+        def connect():
+            self.connections.append(FakeConnection())
+            return self.connections[-1]
+        return ConnectionPool(connect, lambda conn: not conn.closed, **options)
+
+    def test_idle_connections_above_the_minimum_are_closed_on_acquire(self):
+        pool = self.make_pool(min_size=1, max_size=3, idle_timeout=0.05)
+        for conn in [pool.acquire() for _ in range(3)]:
+            pool.release(conn)
+        self.assertEqual(pool.size, 3)
+
+        time.sleep(0.1)
+        conn = pool.acquire()
+        self.assertEqual([c.closed for c in self.connections], [True, True, False])
+        self.assertIs(conn, self.connections[2])
+        self.assertEqual(pool.size, 1)
+
+    def test_reap_keeps_the_minimum(self):
+        pool = self.make_pool(min_size=2, max_size=3, idle_timeout=0.05)
+        for conn in [pool.acquire() for _ in range(3)]:
+            pool.release(conn)
+        time.sleep(0.1)
+        pool.reap()
+        self.assertEqual(pool.size, 2)
+        self.assertEqual(sum(conn.closed for conn in self.connections), 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
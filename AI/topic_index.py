@@ -0,0 +1,311 @@
+import re
+from collections import Counter, deque
+from fuzzywuzzy import fuzz, utils
+
+
+def sort_tokens(text):
+    """Normalize text the way fuzz.token_sort_ratio does before comparing"""
+    return " ".join(sorted(utils.full_process(text, force_ascii=True).split()))
+
+
+def trigrams(text):
+    """Character trigrams of a normalized string, padded so short words still count"""
+    padded = f" {text} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def ratio_bound(matches, len_a, len_b):
+    """Highest ratio two strings can reach if at most `matches` characters line up"""
+    total = len_a + len_b
+    return utils.intr(200.0 * matches / total) if total else 0
+
+
+def words_of(text):
+    return re.findall(r'\b\w+\b', text.lower())
+
+
+class PhraseScanner:
+    """Aho-Corasick automaton over word sequences.
+
+    scan() reports every registered phrase occurring in a list of words in a
+    single left-to-right pass, however many phrases are registered.
+    """
+
+    def __init__(self):
+        self.goto = [{}]
+        self.fail = [0]
+        self.output = [[]]
+
+    def add(self, words, value):
+        state = 0
+        for word in words:
+            next_state = self.goto[state].get(word)
+            if next_state is None:
+                next_state = len(self.goto)
+                self.goto.append({})
+                self.fail.append(0)
+                self.output.append([])
+                self.goto[state][word] = next_state
+            state = next_state
+        self.output[state].append((len(words), value))
+
+    def build(self):
+        """Compute failure links; call once after all phrases are added"""
+        queue = deque(self.goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for word, next_state in self.goto[state].items():
+                queue.append(next_state)
+                fallback = self.fail[state]
+                while fallback and word not in self.goto[fallback]:
+                    fallback = self.fail[fallback]
+                self.fail[next_state] = self.goto[fallback].get(word, 0) if state else 0
+                self.output[next_state] = self.output[next_state] + self.output[self.fail[next_state]]
+
+    def scan(self, words):
+        """Yield (start, end, value) for every phrase found in words"""
+        state = 0
+        for end, word in enumerate(words, 1):
+            while state and word not in self.goto[state]:
+                state = self.fail[state]
+            state = self.goto[state].get(word, 0)
+            for length, value in self.output[state]:
+                yield end - length, end, value
+
+
+class TopicEntry:
+    __slots__ = ('position', 'topic_id', 'name', 'words', 'sorted_name', 'length', 'chars')
+
+    def __init__(self, position, topic_id, name):
+        self.position = position
+        self.topic_id = topic_id
+        self.name = name
+        self.words = words_of(name)
+        self.sorted_name = sort_tokens(name)
+        self.length = len(self.sorted_name)
+        self.chars = Counter(self.sorted_name)
+
+
+class TopicIndex:
+    """Character-trigram inverted index over topic names.
+
+    best_match() returns exactly what a linear scan with fuzz.token_sort_ratio
+    returns (highest score above the threshold, earliest topic on ties), but
+    only scores the few topics that can still win. Topics sharing trigrams
+    with the query are tried first; every other topic is skipped as soon as
+    an upper bound on its score, from string lengths and shared characters,
+    shows it cannot beat the current best.
+    """
+
+    def __init__(self, topics_dict, threshold):
+        self.threshold = threshold
+        self.entries = [TopicEntry(position, topic_id, name)
+                        for position, (topic_id, name) in enumerate(topics_dict.items())]
+        self.postings = {}
+        self.by_length = {}
+        for entry in self.entries:
+            for gram in trigrams(entry.sorted_name):
+                self.postings.setdefault(gram, []).append(entry)
+            self.by_length.setdefault(entry.length, []).append(entry)
+        self.lengths = sorted(self.by_length)
+
+        # Whole topic names and their individual words, for find_in_text()
+        self.scanner = PhraseScanner()
+        for entry in self.entries:
+            if entry.words:
+                self.scanner.add(entry.words, ('name', entry))
+            for word in set(entry.words):
+                if len(word) > 2:
+                    self.scanner.add([word], ('word', entry))
+        self.scanner.build()
+
+    def __len__(self):
+        return len(self.entries)
+
+    def candidates(self, sorted_query):
+        """Topics sharing at least one trigram with the query, most shared first"""
+        shared = Counter()
+        for gram in trigrams(sorted_query):
+            for entry in self.postings.get(gram, ()):
+                shared[entry] += 1
+        return [entry for entry, _ in sorted(shared.items(), key=lambda item: (-item[1], item[0].position))]
+
+    def best_match(self, user_query):
+        """Return (name, score, topic_id) of the best topic above the threshold, or None"""
+        query = sort_tokens(user_query)
+        query_length = len(query)
+        query_chars = Counter(query)
+        best = None
+        best_score = self.threshold
+
+        def can_win(bound, position):
+            # Strictly better score, or an equal score from an earlier topic
+            return bound > best_score or (bound == best_score and best is not None and position < best.position)
+
+        def consider(entry):
+            nonlocal best, best_score
+            if not can_win(ratio_bound(min(query_length, entry.length), query_length, entry.length),
+                           entry.position):
+                return
+            overlap = sum((query_chars & entry.chars).values())
+            if not can_win(ratio_bound(overlap, query_length, entry.length), entry.position):
+                return
+            score = fuzz.ratio(query, entry.sorted_name)
+            if can_win(score, entry.position):
+                best, best_score = entry, score
+
+        seen = set()
+        for entry in self.candidates(query):
+            seen.add(entry.position)
+            consider(entry)
+
+        # Topics with no shared trigram can still score above the threshold,
+        # but only within a narrow band of lengths around the query's
+        for length in self.lengths:
+            if not can_win(ratio_bound(min(query_length, length), query_length, length), -1):
+                continue
+            for entry in self.by_length[length]:
+                if entry.position not in seen:
+                    consider(entry)
+
+        return (best.name, best_score, best.topic_id) if best else None
+
+    def find_in_text(self, text, max_phrase_words=4):
+        """Find the topic mentioned somewhere in a longer query.
+
+        One pass of the phrase scanner finds whole topic names (the longest,
+        then earliest, wins) and topic words. Only when no whole name is
+        present are short phrases around the matched words fuzzy scored;
+        words with no trigram in common with any topic name are never
+        candidates, so the work grows with the query, not the topic list.
+        """
+        words = words_of(text)
+        names = []
+        hits = set()
+        for start, end, (kind, entry) in self.scanner.scan(words):
+            if kind == 'name':
+                names.append((start - end, start, entry.position, entry))
+            else:
+                hits.add(start)
+        if names:
+            entry = min(names, key=lambda name: name[:3])[3]
+            return (entry.name, 100, entry.topic_id)
+
+        # Misspelt topic words never hit the scanner; fall back to words that
+        # share a trigram with some topic name
+        if not hits:
+            hits = {position for position, word in enumerate(words)
+                    if len(word) > 2 and any(gram in self.postings for gram in trigrams(word))}
+
+        spans = sorted({(start, end)
+                        for position in hits
+                        for start in range(max(0, position - max_phrase_words + 1), position + 1)
+                        for end in range(position + 1, min(start + max_phrase_words, len(words)) + 1)})
+        best = None
+        for start, end in spans:
+            phrase = ' '.join(words[start:end])
+            if len(phrase) > 2:
+                match = self.best_match(phrase)
+                if match and (not best or match[1] > best[1]):
+                    best = match
+        return best
+
+
+def deletes(word, max_distance):
+    """word and every string obtained from it by deleting up to max_distance characters"""
+    variants = {word}
+    frontier = {word}
+    for _ in range(max_distance):
+        frontier = {variant[:i] + variant[i + 1:] for variant in frontier for i in range(len(variant))}
+        variants |= frontier
+    return variants
+
+
+def edit_distance(a, b):
+    """Optimal string alignment distance: insertions, deletions,
+    substitutions and swaps of adjacent characters each count one"""
+    previous2, previous = None, list(range(len(b) + 1))
+    for i in range(1, len(a) + 1):
+        current = [i] + [0] * len(b)
+        for j in range(1, len(b) + 1):
+            cost = a[i - 1] != b[j - 1]
+            current[j] = min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + cost)
+            if i > 1 and j > 1 and a[i - 1] == b[j - 2] and a[i - 2] == b[j - 1]:
+                current[j] = min(current[j], previous2[j - 2] + 1)
+        previous2, previous = previous, current
+    return previous[-1]
+
+
+def allowed_distance(word):
+    """Misspellings tolerated in a word: none in very short words, which
+    are too easily another word, and two from six letters up"""
+    return 0 if len(word) < 4 else 1 if len(word) < 6 else 2
+
+
+class TypoIndex:
+    """SymSpell-style spelling corrector over the words of topic names.
+
+    Every topic word is stored under each string its first prefix_length
+    letters become with up to max_distance deletions. A misspelt word is
+    looked up by generating its own deletions, a few dozen dictionary
+    probes however many topics there are, and the candidates found are
+    confirmed with a true edit distance.
+    """
+
+    def __init__(self, topics_dict, max_distance=2, prefix_length=7):
+        self.max_distance = max_distance
+        self.prefix_length = prefix_length
+        self.topics_by_word = {}   # word -> IDs of the topics whose names contain it
+        for topic_id, name in topics_dict.items():
+            for word in dict.fromkeys(words_of(name)):
+                if not word.isdigit():
+                    self.topics_by_word.setdefault(word, []).append(topic_id)
+        self.deletes = {}
+        for word in self.topics_by_word:
+            for variant in deletes(word[:prefix_length], max_distance):
+                self.deletes.setdefault(variant, []).append(word)
+
+    def __len__(self):
+        return len(self.topics_by_word)
+
+    def lookup(self, word, max_distance=None):
+        """Topic words within max_distance edits of word, as (distance, word),
+        closest first and then the words in the most topic names"""
+        if max_distance is None:
+            max_distance = allowed_distance(word)
+        max_distance = min(max_distance, self.max_distance)
+        if word in self.topics_by_word:
+            return [(0, word)]
+        if not max_distance:
+            return []
+        candidates = set()
+        for variant in deletes(word[:self.prefix_length], max_distance):
+            candidates.update(self.deletes.get(variant, ()))
+        matches = []
+        for candidate in candidates:
+            if abs(len(candidate) - len(word)) <= max_distance:
+                distance = edit_distance(word, candidate)
+                if distance <= max_distance:
+                    matches.append((distance, candidate))
+        matches.sort(key=lambda match: (match[0], -len(self.topics_by_word[match[1]]), match[1]))
+        return matches
+
+    def correct(self, text):
+        """text with each misspelt word replaced by its closest topic word"""
+        def replace(match):
+            word = match.group(0)
+            if word.isdigit():
+                return word
+            found = self.lookup(word)
+            return found[0][1] if found else word
+        return re.sub(r'\b\w+\b', replace, text.lower())
+
+    def suggest(self, text, limit=3):
+        """IDs of the topics whose names share the most (nearly) matching
+        words with text, for 'did you mean' suggestions"""
+        scores = {}
+        for word in words_of(text):
+            for distance, candidate in self.lookup(word):
+                for topic_id in self.topics_by_word[candidate]:
+                    scores[topic_id] = scores.get(topic_id, 0) + self.max_distance + 1 - distance
+        return [topic_id for topic_id, _ in sorted(scores.items(), key=lambda item: -item[1])[:limit]]